@@ -0,0 +1,673 @@
+"""
+Grading executors for the Monopoly code testing server
+Submissions run on one of three backends: in the server process itself, in a
+fresh Python subprocess each, or on a pool of pre-forked worker processes that
+already have the grader dependencies imported
+"""
+
+import atexit
+import base64
+import copy
+import cProfile
+import heapq
+import json
+import marshal
+import math
+import multiprocessing
+import os
+import queue
+import shutil
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import metrics
+from tests import (
+    get_limits,
+    get_mode,
+    grader_version,
+    limit_exceeded_result,
+    run_test,
+    submission_fingerprint,
+)
+
+# Number of grading worker processes (0 grades inline in the request thread)
+GRADING_WORKERS = int(os.environ.get("GRADING_WORKERS", os.cpu_count() or 1))
+
+# Where submissions run: "forkserver" (pre-forked worker pool), "subprocess"
+# (a fresh interpreter per submission) or "inprocess" (the request thread)
+GRADING_BACKEND = os.environ.get("GRADING_BACKEND", "forkserver" if GRADING_WORKERS > 0 else "inprocess")
+
+# Modules every worker should have imported before it receives its first job
+PRELOAD_MODULES = ["argparse", "ast", "tests"]
+
+# Extra seconds past a question's wall-clock limit before the parent kills the worker
+KILL_GRACE_SECONDS = 2
+
+# Number of graded submissions remembered by the result cache (0 disables it)
+GRADING_CACHE_SIZE = int(os.environ.get("GRADING_CACHE_SIZE", 4096))
+
+# Asynchronous jobs graded at once, and seconds a finished job's result is kept
+GRADING_JOB_CONCURRENCY = int(os.environ.get("GRADING_JOB_CONCURRENCY", max(GRADING_WORKERS, 1)))
+GRADING_JOB_TTL = float(os.environ.get("GRADING_JOB_TTL", 600))
+
+# Admission control: submissions allowed to wait for a worker beyond those being
+# graded (also caps queued asynchronous jobs), and submissions one client may
+# have in flight at once (0 for no per-client limit); the rest are refused
+GRADING_MAX_QUEUE = int(os.environ.get("GRADING_MAX_QUEUE", 4 * max(GRADING_WORKERS, 1)))
+GRADING_MAX_PER_CLIENT = int(os.environ.get("GRADING_MAX_PER_CLIENT", 0))
+
+
+def _run_job(question_id: str, code: str, mode: Optional[str], profile: bool = False) -> Dict[str, Any]:
+    """
+    Grade one job wherever the executor runs it (a worker, a subprocess or the
+    calling thread). With profile, run_test() runs under cProfile there and
+    result["profile"] holds the stats, base64-encoded in the .prof format
+    pstats loads, so the profile shows the grader with its usual limits.
+    """
+    if not profile:
+        return run_test(question_id, code, mode)
+    profiler = cProfile.Profile()
+    result = profiler.runcall(run_test, question_id, code, mode)
+    profiler.create_stats()
+    result["profile"] = base64.b64encode(marshal.dumps(profiler.stats)).decode("ascii")
+    return result
+
+
+def _worker_main(conn) -> None:
+    """
+    Worker loop: receive (question_id, code, mode, profile) jobs over the pipe, grade
+    them and send the result back. A None job (or a closed pipe) shuts the worker down.
+    """
+    for module in PRELOAD_MODULES:
+        __import__(module)
+    from tests import enable_process_limits, use_scratch_directory
+
+    enable_process_limits()
+    scratch = use_scratch_directory()
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+
+        try:
+            result = _run_job(*job)
+        except BaseException as e:
+            result = worker_error_result(f"Grader crashed: {str(e)}")
+        conn.send(result)
+
+    conn.close()
+    shutil.rmtree(scratch, ignore_errors=True)
+
+
+def _subprocess_main() -> None:
+    """
+    Entry point of a SubprocessExecutor child: grade the one job read from stdin
+    and write the result as the last line of stdout
+    """
+    from tests import enable_process_limits, use_scratch_directory
+
+    enable_process_limits()
+    scratch = use_scratch_directory()
+    job = json.loads(sys.stdin.read())
+    try:
+        result = _run_job(job["question_id"], job["code"], job["mode"], job["profile"])
+    except BaseException as e:
+        result = worker_error_result(f"Grader crashed: {str(e)}")
+    shutil.rmtree(scratch, ignore_errors=True)
+    sys.stdout.write("\n" + json.dumps(result) + "\n")
+    sys.stdout.flush()
+
+
+def worker_error_result(message: str) -> Dict[str, Any]:
+    """Build a failed test result for a submission the pool could not grade"""
+    return {
+        "passed": False,
+        "tests": {},
+        "output": f"Error: {message}",
+        "message": message
+    }
+
+
+class GradingBusy(Exception):
+    """Raised when admission control refuses a submission; retry_after is in whole seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Worker:
+    """A grading process and the parent's end of its pipe"""
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def stop(self, kill: bool = False) -> None:
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    """
+    Fixed-size pool of pre-forked grading processes
+    Request threads block until a worker is idle, so at most `size` submissions
+    are graded at once and each runs on its own core.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._context = self._make_context()
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(size):
+            worker = _Worker(self._context)
+            self._workers.append(worker)
+            self._idle.put(worker)
+
+    @staticmethod
+    def _make_context():
+        # forkserver forks every worker from a clean, pre-imported parent, which is
+        # safe even though Flask's request threads are running in this process
+        if sys.platform != "win32" and "forkserver" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("forkserver")
+            context.set_forkserver_preload(PRELOAD_MODULES)
+            return context
+        return multiprocessing.get_context("spawn")
+
+    def _replace(self, worker: _Worker) -> _Worker:
+        """Kill a broken worker and start a fresh one in its place"""
+        worker.stop(kill=True)
+        replacement = _Worker(self._context)
+        with self._lock:
+            self._workers[self._workers.index(worker)] = replacement
+        return replacement
+
+    def run(self, question_id: str, code: str, mode: Optional[str] = None,
+            timeout: Optional[float] = None, profile: bool = False) -> Dict[str, Any]:
+        """Grade one submission on the next idle worker"""
+        if self._closed:
+            raise RuntimeError("Grading pool is closed")
+
+        worker = self._idle.get()
+        try:
+            worker.conn.send((question_id, code, mode, profile))
+            if not worker.conn.poll(timeout):
+                # The worker's own limits didn't stop the submission (e.g. it is
+                # stuck in a C call), so kill the process
+                worker = self._replace(worker)
+                return limit_exceeded_result(f"Time limit exceeded ({timeout} seconds)")
+            return worker.conn.recv()
+        except (EOFError, OSError):
+            # The worker died mid-job (e.g. killed by the OS); start a new one
+            worker = self._replace(worker)
+            return worker_error_result("Grading worker exited unexpectedly")
+        finally:
+            self._idle.put(worker)
+
+    def close(self) -> None:
+        self._closed = True
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.stop()
+
+
+class InProcessExecutor:
+    """
+    Grades in the calling thread: no process overhead at all, but a submission
+    shares the server's memory and only the thread-level limits apply
+    """
+
+    def run(self, question_id: str, code: str, mode: Optional[str] = None,
+            timeout: Optional[float] = None, profile: bool = False) -> Dict[str, Any]:
+        return _run_job(question_id, code, mode, profile)
+
+    def close(self) -> None:
+        pass
+
+
+class SubprocessExecutor:
+    """
+    Grades every submission in a fresh Python interpreter, the code passed over
+    stdin: the strongest isolation, at the cost of an interpreter start per run.
+    At most `size` run at once.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._slots = threading.BoundedSemaphore(size)
+        self._command = [sys.executable, "-c", "import grading; grading._subprocess_main()"]
+
+    def run(self, question_id: str, code: str, mode: Optional[str] = None,
+            timeout: Optional[float] = None, profile: bool = False) -> Dict[str, Any]:
+        job = json.dumps({"question_id": question_id, "code": code, "mode": mode, "profile": profile})
+        with self._slots:
+            try:
+                completed = subprocess.run(self._command, input=job, capture_output=True, text=True,
+                                           timeout=timeout, cwd=Path(__file__).parent)
+            except subprocess.TimeoutExpired:
+                return limit_exceeded_result(f"Time limit exceeded ({timeout} seconds)")
+        lines = completed.stdout.rstrip("\n").rsplit("\n", 1)
+        try:
+            return json.loads(lines[-1])
+        except ValueError:
+            return worker_error_result("Grading subprocess exited unexpectedly")
+
+    def close(self) -> None:
+        pass
+
+
+# Executor backends selectable with GRADING_BACKEND
+EXECUTOR_BACKENDS = {
+    "inprocess": lambda: InProcessExecutor(),
+    "subprocess": lambda: SubprocessExecutor(max(GRADING_WORKERS, 1)),
+    "forkserver": lambda: WorkerPool(max(GRADING_WORKERS, 1)),
+}
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of grading results
+    Keyed by (question_id, submission fingerprint, grader version, grading mode), so resubmitting
+    the same code with different whitespace or comments is answered without
+    running the grader, and editing a grader invalidates its entries.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str, str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(question_id: str, code: str, mode: str) -> Tuple[str, str, str, str]:
+        return (question_id, submission_fingerprint(question_id, code), grader_version(question_id), mode)
+
+    def get(self, key: Tuple[str, str, str, str]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            result = self._entries.get(key)
+            if result is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(result)
+
+    def put(self, key: Tuple[str, str, str, str], result: Dict[str, Any]) -> None:
+        # Limit violations and worker failures depend on load, not just the code
+        if not result.get("tests") or "resource_limits" in result["tests"]:
+            return
+        with self._lock:
+            self._entries[key] = copy.deepcopy(result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+cache = ResultCache(GRADING_CACHE_SIZE)
+
+
+class AdmissionControl:
+    """
+    Bounds the submissions waiting for a grading worker
+    At most `limit` (capacity + max_queue) are admitted at once, and with
+    max_per_client set no client may hold more than that many; anything past the
+    bounds is refused straight away with an estimate of when to retry, so a
+    burst costs the late arrivals a retry instead of costing everyone their latency.
+    Every request thread that blocks on grading holds a place (a batch request
+    holds one for the whole batch), so `limit` also bounds the server threads
+    grading can tie up. Asynchronous jobs don't block request threads; they are
+    bounded by GradingJobs instead.
+    """
+
+    def __init__(self, capacity: int, max_queue: int, max_per_client: int = 0):
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.max_per_client = max_per_client
+        self.admitted = 0
+        self.rejected = 0
+        self._clients: Dict[str, int] = {}
+        # Moving average of how long an admitted submission holds its place
+        self.mean_seconds = 0.1
+        self._lock = threading.Lock()
+
+    @property
+    def limit(self) -> int:
+        return self.capacity + self.max_queue
+
+    def _retry_after(self) -> int:
+        # Time for the submissions ahead to drain through the workers
+        return max(1, math.ceil((self.admitted - self.capacity + 1) * self.mean_seconds / self.capacity))
+
+    def acquire(self, client: str) -> None:
+        """Take a place for client, or raise GradingBusy; pair with release()"""
+        with self._lock:
+            if self.admitted >= self.limit:
+                self.rejected += 1
+                GRADING_REJECTED.inc(reason="queue_full")
+                raise GradingBusy("The grading queue is full, please try again shortly", self._retry_after())
+            if self.max_per_client and self._clients.get(client, 0) >= self.max_per_client:
+                self.rejected += 1
+                GRADING_REJECTED.inc(reason="client_limit")
+                raise GradingBusy("Your previous submission is still being graded, please wait for it to finish",
+                                  self._retry_after())
+            self.admitted += 1
+            self._clients[client] = self._clients.get(client, 0) + 1
+
+    def release(self, client: str) -> None:
+        with self._lock:
+            self.admitted -= 1
+            self._clients[client] -= 1
+            if not self._clients[client]:
+                del self._clients[client]
+
+    @contextmanager
+    def admit(self, client: str):
+        """Hold a place while grading one submission, timing it for the retry estimate"""
+        self.acquire(client)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(client)
+            with self._lock:
+                self.mean_seconds = 0.8 * self.mean_seconds + 0.2 * (time.perf_counter() - start)
+
+
+admission = AdmissionControl(max(GRADING_WORKERS, 1), GRADING_MAX_QUEUE, GRADING_MAX_PER_CLIENT)
+
+
+class ResourceStats:
+    """
+    Running totals of the "resources" that graded results report, per question,
+    plus the slowest submissions seen, so pathological questions and
+    submissions can be found without a profiler
+    """
+
+    def __init__(self, keep_slowest: int = 10):
+        self.keep_slowest = keep_slowest
+        self._questions: Dict[str, Dict[str, float]] = {}
+        self._slowest: List[Tuple[float, int, Dict[str, Any]]] = []
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def record(self, question_id: str, code: str, resources: Dict[str, Any]) -> None:
+        with self._lock:
+            totals = self._questions.setdefault(question_id, {
+                "submissions": 0, "wall_ms": 0.0, "cpu_ms": 0.0, "exec_calls": 0, "cases_run": 0,
+                "max_wall_ms": 0.0, "max_peak_memory_delta_kb": 0
+            })
+            totals["submissions"] += 1
+            for field in ("wall_ms", "cpu_ms", "exec_calls", "cases_run"):
+                totals[field] = round(totals[field] + resources[field], 3)
+            totals["max_wall_ms"] = max(totals["max_wall_ms"], resources["wall_ms"])
+            totals["max_peak_memory_delta_kb"] = max(totals["max_peak_memory_delta_kb"],
+                                                     resources["peak_memory_delta_kb"] or 0)
+
+            # Min-heap on wall time keeps the slowest submissions
+            self._seq += 1
+            entry = (resources["wall_ms"], self._seq, {"question_id": question_id, "code": code[:200], **resources})
+            if len(self._slowest) < self.keep_slowest:
+                heapq.heappush(self._slowest, entry)
+            else:
+                heapq.heappushpop(self._slowest, entry)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "questions": copy.deepcopy(self._questions),
+                "slowest": [entry[2] for entry in sorted(self._slowest, reverse=True)]
+            }
+
+
+resource_stats = ResourceStats()
+
+
+def _queue_depth() -> int:
+    """Submissions handed to the executor that are waiting for a free worker"""
+    size = getattr(_executor, "size", None)
+    in_flight = GRADING_IN_FLIGHT.value()
+    return max(0, in_flight - size) if size else 0
+
+
+# Exposed by GET /metrics
+GRADING_SECONDS = metrics.histogram("grading_duration_seconds",
+                                    "Time to grade a submission, cache hits included", ["question_id"])
+GRADING_RESULTS = metrics.counter("grading_results_total",
+                                  "Graded submissions by question and outcome (passed or failed)", ["question_id", "result"])
+GRADING_CPU_SECONDS = metrics.counter("grading_cpu_seconds_total",
+                                      "CPU time spent running submissions' code", ["question_id"])
+GRADING_REJECTED = metrics.counter("grading_rejected_total",
+                                   "Submissions refused by admission control, by reason", ["reason"])
+GRADING_IN_FLIGHT = metrics.gauge("grading_in_flight", "Submissions running on or waiting for the grading executor")
+metrics.gauge("grading_queue_depth", "Submissions waiting for a free grading worker", function=_queue_depth)
+metrics.gauge("grading_jobs_queued", "Asynchronous grading jobs not yet started", function=lambda: jobs.queued())
+metrics.gauge("grading_cache_entries", "Results held in the grading cache", function=lambda: cache.stats()["size"])
+metrics.counter("grading_cache_hits_total", "Submissions answered from the grading cache", function=lambda: cache.hits)
+metrics.counter("grading_cache_misses_total", "Submissions not found in the grading cache", function=lambda: cache.misses)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Return the shared executor for GRADING_BACKEND, starting it on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if GRADING_BACKEND not in EXECUTOR_BACKENDS:
+                raise ValueError(f"Unknown GRADING_BACKEND: {GRADING_BACKEND} "
+                                 f"(expected one of: {', '.join(EXECUTOR_BACKENDS)})")
+            _executor = EXECUTOR_BACKENDS[GRADING_BACKEND]()
+            atexit.register(_executor.close)
+        return _executor
+
+
+def grade(question_id: str, code: str, mode: Optional[str] = None, profile: bool = False,
+          client: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Grade a submission, from the result cache or on the configured executor
+    mode is "full" or "fail_fast"; None uses the question's default
+    profile=True skips the cache and grades under cProfile on the executor
+    itself, with the usual isolation and limits; result["profile"] then holds
+    the stats (see _run_job)
+    Interactive submissions pass the submitting client (team or address): a
+    cache miss then goes through admission control, raising GradingBusy if full
+    Returns the same result dict as tests.run_test()
+    """
+    start = time.perf_counter()
+    result = _grade(question_id, code, get_mode(question_id, mode), client, profile)
+    GRADING_SECONDS.observe(time.perf_counter() - start, question_id=question_id)
+    GRADING_RESULTS.inc(question_id=question_id, result="passed" if result["passed"] else "failed")
+    return result
+
+
+def _grade(question_id: str, code: str, mode: str, client: Optional[str], profile: bool) -> Dict[str, Any]:
+    key = None
+    if cache.max_size > 0 and not profile:
+        key = cache.key(question_id, code, mode)
+        cached = cache.get(key)
+        if cached is not None:
+            if cached.get("resources"):
+                # What the original run used; this request cost only a lookup
+                cached["resources"]["cached"] = True
+            return cached
+
+    timeout = get_limits(question_id)["wall_seconds"] + KILL_GRACE_SECONDS
+    with admission.admit(client) if client is not None else nullcontext():
+        GRADING_IN_FLIGHT.inc()
+        try:
+            result = get_executor().run(question_id, code, mode, timeout=timeout, profile=profile)
+        finally:
+            GRADING_IN_FLIGHT.dec()
+    # The profiler's overhead would skew the per-question totals
+    if result.get("resources") and not profile:
+        resource_stats.record(question_id, code, result["resources"])
+        GRADING_CPU_SECONDS.inc(result["resources"]["cpu_ms"] / 1000, question_id=question_id)
+
+    if key is not None:
+        cache.put(key, result)
+    return result
+
+
+_dispatcher: Optional[ThreadPoolExecutor] = None
+
+
+def _get_dispatcher() -> ThreadPoolExecutor:
+    """Threads that feed batch submissions to the pool, one per worker process"""
+    global _dispatcher
+    with _executor_lock:
+        if _dispatcher is None:
+            size = GRADING_WORKERS if GRADING_WORKERS > 0 else (os.cpu_count() or 1)
+            _dispatcher = ThreadPoolExecutor(max_workers=size, thread_name_prefix="grading-batch")
+        return _dispatcher
+
+
+def grade_batch(submissions: List[Tuple[str, str, Optional[str]]]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Grade many (question_id, code, mode) submissions concurrently
+    Yields (index, result) pairs as each one finishes, so callers can report
+    progress; index is the submission's position in the input list.
+    """
+    executor = _get_dispatcher()
+    futures = {executor.submit(grade, *submission): index for index, submission in enumerate(submissions)}
+    for future in as_completed(futures):
+        yield futures[future], future.result()
+
+
+class GradingJobs:
+    """
+    Asynchronous grading: submissions are queued and graded by at most
+    max_concurrent threads, and callers poll for the result by job ID.
+    At most max_queued jobs wait to start; submitting more raises GradingBusy.
+    Finished jobs are forgotten ttl seconds after they complete.
+    """
+
+    def __init__(self, max_concurrent: int, ttl: float, max_queued: int):
+        self.ttl = ttl
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="grading-job")
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, question_id: str, code: str, mode: Optional[str] = None) -> str:
+        """Queue a submission and return its job ID, or raise GradingBusy if max_queued are already waiting"""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._expire()
+            if sum(1 for job in self._jobs.values() if job["status"] == "queued") >= self.max_queued:
+                GRADING_REJECTED.inc(reason="jobs_queue_full")
+                raise GradingBusy("The grading queue is full, please try again shortly",
+                                  max(1, math.ceil(self.max_queued * admission.mean_seconds / self.max_concurrent)))
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "question_id": question_id,
+                "status": "queued",
+                "submitted_at": time.time(),
+                "finished_at": None,
+                "result": None
+            }
+        self._executor.submit(self._run, job_id, question_id, code, mode)
+        return job_id
+
+    def _run(self, job_id: str, question_id: str, code: str, mode: Optional[str]) -> None:
+        with self._lock:
+            self._jobs[job_id]["status"] = "running"
+        try:
+            result = grade(question_id, code, mode)
+        except Exception as e:
+            result = worker_error_result(f"Grading failed: {str(e)}")
+        with self._lock:
+            self._jobs[job_id].update(status="done", result=result, finished_at=time.time())
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Snapshot of a job's status (and result once done), or None if unknown or expired"""
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def queued(self) -> int:
+        """Number of jobs waiting to start"""
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job["status"] == "queued")
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job["finished_at"] and job["finished_at"] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+jobs = GradingJobs(GRADING_JOB_CONCURRENCY, GRADING_JOB_TTL, GRADING_MAX_QUEUE)
+
+
+def benchmark(backends: List[str], rounds: int = 3) -> None:
+    """
+    Grade every CODE_ANSWER_KEY.md solution `rounds` times on each backend and
+    print the start-up cost and per-submission latency, bypassing the cache
+    """
+    from tests import load_reference_solutions
+
+    submissions = [(question_id, code) for question_id, solutions in load_reference_solutions().items()
+                   for code in solutions]
+    print(f"{len(submissions)} reference solutions x {rounds} rounds")
+    for backend in backends:
+        start = time.perf_counter()
+        executor = EXECUTOR_BACKENDS[backend]()
+        first_question, first_code = submissions[0]
+        executor.run(first_question, first_code, timeout=30)
+        startup_ms = (time.perf_counter() - start) * 1000
+
+        latencies = []
+        for _ in range(rounds):
+            for question_id, code in submissions:
+                start = time.perf_counter()
+                executor.run(question_id, code, timeout=30)
+                latencies.append((time.perf_counter() - start) * 1000)
+        executor.close()
+
+        latencies.sort()
+        print(f"{backend:>10}: start-up + first run {startup_ms:8.1f} ms | "
+              f"mean {statistics.mean(latencies):7.2f} ms | "
+              f"p50 {latencies[len(latencies) // 2]:7.2f} ms | "
+              f"p95 {latencies[int(len(latencies) * 0.95)]:7.2f} ms")
+
+
+if __name__ == "__main__":
+    # python grading.py [backend ...] - compare executor backends (all by default)
+    benchmark(sys.argv[1:] or list(EXECUTOR_BACKENDS))
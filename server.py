@@ -4,23 +4,126 @@ Monopoly Game Code Testing Server
 Receives Python code submissions and validates them using question-specific test suites
 """
 
-from flask import Flask, request, jsonify
+import time
+_started = time.perf_counter()
+
+from flask import Flask, Response, abort, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-import subprocess
+import argparse
+import base64
+import cProfile
+import gzip
+import hashlib
+import hmac
 import sys
 import os
-import tempfile
 import re
 import json
+import tempfile
+import threading
+import uuid
+import zlib
 from pathlib import Path
-from tests import run_test, TEST_REGISTRY
+from typing import Optional
+from tests import GRADING_MODES, TEST_REGISTRY, verify_reference_solutions
+import grading
+import metrics
+
+try:
+    import waitress
+except ImportError:  # --production falls back to Flask's threaded server
+    waitress = None
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for React frontend
 
+# Largest request body accepted, in bytes; bigger requests get a 413
+MAX_REQUEST_BYTES = int(os.environ.get("MAX_REQUEST_BYTES", 4 * 1024 * 1024))
+app.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_BYTES
+
+# Production server (python server.py --production): request threads, and how long
+# an idle keep-alive connection is held open. Grading may tie up at most
+# grading.admission.limit threads; RESERVED_THREADS more are kept for the other routes
+RESERVED_THREADS = 4
+SERVER_THREADS = int(os.environ.get("SERVER_THREADS", grading.admission.limit + RESERVED_THREADS))
+KEEPALIVE_SECONDS = int(os.environ.get("KEEPALIVE_SECONDS", 30))
+
 # Path to game state file
 GAME_STATE_FILE = Path(__file__).parent / "game_state.json"
 
+# Other games are stored as <game_id>.json in GAMES_DIR; requests without a
+# game_id use the default game, kept in GAME_STATE_FILE as before
+GAMES_DIR = Path(os.environ.get("GAMES_DIR", Path(__file__).parent / "games"))
+DEFAULT_GAME_ID = "default"
+GAME_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Games not saved for this many seconds are removed by garbage collection
+# (POST /games/gc, and whenever a game is created); the default game never is
+GAME_TTL_SECONDS = float(os.environ.get("GAME_TTL_SECONDS", 7 * 24 * 3600))
+
+# Shared secret for administrative requests such as aggressive garbage
+# collection (sent as X-Admin-Token); unset disables them
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+
+def game_state_path(game_id: str) -> Path:
+    """Where a game's state is stored (game_id must already be validated)"""
+    if game_id == DEFAULT_GAME_ID:
+        return GAME_STATE_FILE
+    return GAMES_DIR / f"{game_id}.json"
+
+def stored_games() -> list:
+    """(game_id, path, stat) for every game with a state file"""
+    paths = [(DEFAULT_GAME_ID, GAME_STATE_FILE)]
+    if GAMES_DIR.is_dir():
+        paths += [(path.stem, path) for path in GAMES_DIR.glob("*.json") if GAME_ID_PATTERN.match(path.stem)]
+    games = []
+    for game_id, path in paths:
+        try:
+            games.append((game_id, path, path.stat()))
+        except FileNotFoundError:
+            continue
+    return games
+
+def _game_state_bytes() -> int:
+    return sum(stat.st_size for _, _, stat in stored_games())
+
+# Exposed by GET /metrics, alongside the grading metrics in grading.py
+REQUEST_SECONDS = metrics.histogram("http_request_duration_seconds",
+                                    "Time to handle a request, by route, method and status", ["route", "method", "status"])
+GAME_STATE_WRITE_SECONDS = metrics.histogram("game_state_write_seconds", "Time to write the game state file")
+metrics.gauge("game_state_file_bytes", "Total size of the saved game state files", function=_game_state_bytes)
+metrics.gauge("games_stored", "Games with a saved state file", function=lambda: len(stored_games()))
+
+# /load-game-state responses, per game state file (see game_state_entry)
+_game_state_cache: dict = {}
+_game_state_lock = threading.Lock()
+
+# Content-Encodings /load-game-state can send, in order of preference, and the
+# smallest body worth compressing
+COMPRESSORS = {
+    "gzip": lambda body: gzip.compress(body, compresslevel=6),
+    "deflate": lambda body: zlib.compress(body, 6)
+}
+COMPRESS_MIN_BYTES = 1024
+
+# Opt-in profiling: requests to a route in PROFILE_ROUTES (comma-separated, e.g.
+# "/save-game-state"), or carrying PROFILE_TOKEN in an X-Profile-Token header or
+# ?profile= query parameter, run under cProfile with the dump written to PROFILE_DIR
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", Path(__file__).parent / "profiles"))
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_ROUTES = {route.strip() for route in os.environ.get("PROFILE_ROUTES", "").split(",") if route.strip()}
+
+# One profiled request at a time; others that ask for it run unprofiled
+_profile_lock = threading.Lock()
+
+# Most submissions accepted by one /test-code/batch request
+MAX_BATCH_SIZE = 1000
+
+# Whether to grade every CODE_ANSWER_KEY.md solution with its own grader at
+# startup: "off" (skip it, so graders stay unloaded until first used), "warn"
+# (print failures) or "strict" (refuse to start); `python tests.py` always checks
+VERIFY_REFERENCES = os.environ.get("GRADING_VERIFY_REFERENCES", "off")
+
 def normalize_output(output: str) -> str:
     """Normalize output for comparison (strip whitespace, handle newlines)"""
     if not output:
@@ -32,42 +135,6 @@ def normalize_output(output: str) -> str:
         lines.pop()
     return '\n'.join(lines)
 
-def execute_code(code: str, timeout: int = 5) -> tuple[str, str, bool]:
-    """
-    Execute Python code safely and return (stdout, stderr, success)
-    Returns empty strings and False if execution fails
-    """
-    try:
-        # Create a temporary file for the code
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
-            f.write(code)
-            temp_file = f.name
-        
-        try:
-            # Execute the code with timeout
-            result = subprocess.run(
-                [sys.executable, temp_file],
-                capture_output=True,
-                text=True,
-                timeout=timeout,
-                cwd=tempfile.gettempdir()
-            )
-            
-            stdout = normalize_output(result.stdout)
-            stderr = normalize_output(result.stderr)
-            success = result.returncode == 0
-            
-            return stdout, stderr, success
-        finally:
-            # Clean up temp file
-            if os.path.exists(temp_file):
-                os.unlink(temp_file)
-                
-    except subprocess.TimeoutExpired:
-        return "", "Code execution timed out (exceeded 5 seconds)", False
-    except Exception as e:
-        return "", f"Execution error: {str(e)}", False
-
 def compare_outputs(actual: str, expected: str) -> bool:
     """
     Compare actual output with expected output
@@ -99,84 +166,416 @@ def compare_outputs(actual: str, expected: str) -> bool:
     
     return False
 
+def submission_error(message: str) -> dict:
+    """Response body for a code submission that could not be graded"""
+    return {
+        "success": False,
+        "valid": False,
+        "output": "",
+        "error": message
+    }
+
+def validate_mode(mode) -> Optional[str]:
+    """Error message for an unknown grading mode, or None if it is valid (or not given)"""
+    if mode is not None and mode not in GRADING_MODES:
+        return f"Invalid mode: {mode} (expected one of: {', '.join(GRADING_MODES)})"
+    return None
+
+def validate_submission(data) -> tuple[str, str, Optional[str], Optional[str]]:
+    """
+    Pull the code, question_id and optional grading mode out of a submission
+    Returns (code, question_id, mode, error) where error is None if it can be graded
+    """
+    if not data:
+        return "", "", None, "No data provided"
+    
+    code = data.get('code', '').strip()
+    question_id = data.get('question_id', '').strip()
+    mode = data.get('mode')
+    
+    if not code:
+        return code, question_id, mode, "No code provided"
+    
+    if not question_id:
+        return code, question_id, mode, "No question_id provided"
+    
+    # Check if test exists for this question
+    if question_id not in TEST_REGISTRY:
+        return code, question_id, mode, f"No test suite found for question_id: {question_id}"
+    
+    return code, question_id, mode, validate_mode(mode)
+
+def client_key(data: dict) -> str:
+    """
+    Who a submission counts against for GRADING_MAX_PER_CLIENT: the optional
+    "team_id" in the request body (or X-Team-Id header) within its game
+    ("game_id", as for the game state routes), else the client address
+    Team IDs repeat in every game, so they only identify a team together with the game
+    """
+    team_id = data.get('team_id')
+    if team_id is None:
+        team_id = request.headers.get('X-Team-Id')
+    if isinstance(team_id, (str, int)) and str(team_id).strip():
+        game_id, error = request_game_id(data)
+        if error:
+            game_id = DEFAULT_GAME_ID
+        return f"team:{game_id}:{str(team_id).strip()}"
+    return f"addr:{request.remote_addr}"
+
+def busy_response(error: grading.GradingBusy, body: Optional[dict] = None):
+    """429 for a submission refused by admission control, with a Retry-After header"""
+    response = jsonify(body if body is not None else submission_error(str(error)))
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response, 429
+
+def test_code_response(test_results: dict) -> dict:
+    """Response body for a graded submission"""
+    # Get output from test results (captured during first test execution)
+    output = test_results.get("output", "")
+    
+    return {
+        "success": True,
+        "valid": test_results["passed"],
+        "output": output,
+        "error": None if test_results["passed"] else test_results.get("error_message", test_results["message"]),
+        "test_result": {
+            "message": test_results["message"],
+            "tests": test_results["tests"],
+            "resources": test_results.get("resources")
+        }
+    }
+
 @app.route('/test-code', methods=['POST'])
 def test_code():
     """
     Test Python code using question-specific test suite
-    Request body: { "code": str, "question_id": str }
+    Request body: { "code": str, "question_id": str, "mode": "full" | "fail_fast", "async": bool, "team_id": str, "game_id": str }
     Response: { "success": bool, "valid": bool, "output": str, "error": str, "test_result": dict }
+    "mode" is optional: "fail_fast" stops at the first failing test case, and
+    without it the question's default (usually "full") is used
+    With "async": true the submission is queued instead and the response is
+    202 { "success": true, "job_id": str, "status": "queued" }; poll GET /test-code/jobs/<job_id>
+    When the grading queue is full (or the team already has GRADING_MAX_PER_CLIENT
+    submissions in flight) the response is 429 with a Retry-After header
     """
     try:
         data = request.get_json()
+        code, question_id, mode, error = validate_submission(data)
+        if error:
+            return jsonify(submission_error(error)), 400
         
-        if not data:
-            return jsonify({
-                "success": False,
-                "valid": False,
-                "output": "",
-                "error": "No data provided"
-            }), 400
+        if data.get('async'):
+            job_id = grading.jobs.submit(question_id, code, mode)
+            response = jsonify({
+                "success": True,
+                "job_id": job_id,
+                "status": "queued"
+            })
+            response.headers["Location"] = f"/test-code/jobs/{job_id}"
+            return response, 202
+        
+        # Run the specific test suite for this question on a grading worker
+        # The test suite handles execution with proper variable setup and error checking
+        test_results = grading.grade(question_id, code, mode, profile="profiler" in g, client=client_key(data))
+        if "profile" in test_results:
+            # Written next to the request's own profile by write_profile()
+            g.grader_profile = base64.b64decode(test_results.pop("profile"))
         
-        code = data.get('code', '').strip()
-        question_id = data.get('question_id', '').strip()
+        return jsonify(test_code_response(test_results)), 200
         
-        if not code:
+    except grading.GradingBusy as e:
+        return busy_response(e)
+    except Exception as e:
+        return jsonify(submission_error(f"Server error: {str(e)}")), 500
+
+@app.route('/test-code/jobs/<job_id>', methods=['GET'])
+def test_code_job(job_id):
+    """
+    Poll an asynchronous grading job
+    Response: { "success": bool, "job_id": str, "status": "queued" | "running" | "done", "result": <same body as /test-code> | null }
+    """
+    job = grading.jobs.get(job_id)
+    if job is None:
+        return jsonify({
+            "success": False,
+            "job_id": job_id,
+            "status": None,
+            "result": None,
+            "error": "Unknown or expired job_id"
+        }), 404
+    
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status": job["status"],
+        "result": test_code_response(job["result"]) if job["result"] else None
+    }), 200
+
+@app.route('/test-code/batch', methods=['POST'])
+def test_code_batch():
+    """
+    Test many submissions at once, graded in parallel on the worker pool
+    Request body: { "submissions": [{ "code": str, "question_id": str, "mode": str }, ...], "mode": str, "stream": bool }
+    Response: { "success": bool, "results": [<same body as /test-code>, ...] } in input order
+    The top-level "mode" applies to every submission that doesn't set its own
+    With "stream": true the response is newline-delimited JSON: one
+    { "type": "progress", "index": int, "completed": int, "total": int } line per
+    graded submission, then { "type": "results", "results": [...] }
+    """
+    try:
+        data = request.get_json()
+        submissions = data.get('submissions') if data else None
+        
+        if not isinstance(submissions, list) or not submissions:
             return jsonify({
                 "success": False,
-                "valid": False,
-                "output": "",
-                "error": "No code provided"
+                "results": [],
+                "error": "No submissions provided"
             }), 400
         
-        if not question_id:
+        if len(submissions) > MAX_BATCH_SIZE:
             return jsonify({
                 "success": False,
-                "valid": False,
-                "output": "",
-                "error": "No question_id provided"
+                "results": [],
+                "error": f"Too many submissions (maximum is {MAX_BATCH_SIZE})"
             }), 400
         
-        # Check if test exists for this question
-        if question_id not in TEST_REGISTRY:
+        batch_mode = data.get('mode')
+        mode_error = validate_mode(batch_mode)
+        if mode_error:
             return jsonify({
                 "success": False,
-                "valid": False,
-                "output": "",
-                "error": f"No test suite found for question_id: {question_id}"
+                "results": [],
+                "error": mode_error
             }), 400
         
-        # Run the specific test suite for this question
-        # The test suite handles execution with proper variable setup and error checking
-        test_results = run_test(question_id, code)
+        # Invalid submissions get an error in their slot; the rest are graded
+        results = [None] * len(submissions)
+        to_grade = []
+        for index, submission in enumerate(submissions):
+            code, question_id, mode, error = validate_submission(submission if isinstance(submission, dict) else None)
+            if error:
+                results[index] = submission_error(error)
+            else:
+                to_grade.append((index, question_id, code, mode or batch_mode))
+        
+        def stream(graded):
+            completed = len(submissions) - len(to_grade)
+            for position, test_results in graded:
+                index = to_grade[position][0]
+                results[index] = test_code_response(test_results)
+                completed += 1
+                yield json.dumps({"type": "progress", "index": index, "completed": completed, "total": len(submissions)}) + "\n"
+            yield json.dumps({"type": "results", "results": results}) + "\n"
+        
+        # The whole batch holds one admission place, since it ties up one request thread
+        client = client_key(data)
+        grading.admission.acquire(client)
+        admitted = True
+        try:
+            graded = grading.grade_batch([(question_id, code, mode) for _, question_id, code, mode in to_grade])
+            
+            if not data.get('stream'):
+                for position, test_results in graded:
+                    results[to_grade[position][0]] = test_code_response(test_results)
+                return jsonify({"success": True, "results": results}), 200
+            
+            response = Response(stream_with_context(stream(graded)), mimetype="application/x-ndjson")
+            # A streamed batch keeps grading after this returns; release once it is sent
+            response.call_on_close(lambda: grading.admission.release(client))
+            admitted = False
+            return response
+        finally:
+            if admitted:
+                grading.admission.release(client)
+        
+    except grading.GradingBusy as e:
+        return busy_response(e, {"success": False, "results": [], "error": str(e)})
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "results": [],
+            "error": f"Server error: {str(e)}"
+        }), 500
+
+@app.route('/grading-stats', methods=['GET'])
+def grading_stats():
+    """
+    Aggregate grading resource usage, to find slow questions and submissions
+    Response: { "success": bool, "cache": dict, "questions": { question_id: totals }, "slowest": [dict, ...] }
+    """
+    return jsonify({
+        "success": True,
+        "cache": grading.cache.stats(),
+        **grading.resource_stats.snapshot()
+    }), 200
+
+def is_admin_request() -> bool:
+    """Whether the request carries ADMIN_TOKEN in an X-Admin-Token header (never, if it is unset)"""
+    token = request.headers.get("X-Admin-Token")
+    return bool(ADMIN_TOKEN and token and hmac.compare_digest(token, ADMIN_TOKEN))
+
+# Serializes writes to each game's file; games don't wait on each other
+_game_locks: dict = {}
+_game_locks_lock = threading.Lock()
+
+def game_lock(game_id: str) -> threading.Lock:
+    """The lock for a game that exists or is being created; see forget_game_lock()"""
+    with _game_locks_lock:
+        return _game_locks.setdefault(game_id, threading.Lock())
+
+def forget_game_lock(game_id: str) -> None:
+    """Drop a deleted game's lock, so IDs that no longer exist don't accumulate"""
+    with _game_locks_lock:
+        _game_locks.pop(game_id, None)
+
+def request_game_id(data: Optional[dict] = None) -> tuple[str, Optional[str]]:
+    """
+    The game a request is for: the game_id query parameter, else "game_id" in
+    the JSON body, else the default game
+    Returns (game_id, error) where error is None if the ID is valid
+    """
+    game_id = request.args.get('game_id')
+    if game_id is None and isinstance(data, dict):
+        game_id = data.get('game_id')
+    if game_id is None:
+        return DEFAULT_GAME_ID, None
+    if not isinstance(game_id, str) or not GAME_ID_PATTERN.match(game_id):
+        return "", "Invalid game_id (use 1-64 letters, digits, '-' or '_')"
+    return game_id, None
+
+def write_game_state(game_id: str, game_state) -> None:
+    """
+    Replace a game's state file atomically, so a concurrent load sees either
+    the old state or the new one, never a partial write
+    """
+    path = game_state_path(game_id)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    with game_lock(game_id):
+        # A unique temporary name, in case a delete dropped the lock another save holds
+        fd, temp_path = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+        try:
+            with open(fd, 'w') as f:
+                if isinstance(game_state, str):
+                    # It's already a JSON string, write it as-is
+                    f.write(game_state)
+                else:
+                    # It's an object, stringify it
+                    json.dump(game_state, f, indent=2)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+    GAME_STATE_WRITE_SECONDS.observe(time.perf_counter() - start)
+    forget_game_state(path)
+
+def collect_stale_games(max_age_seconds: float) -> list:
+    """Delete every game (except the default) not saved in max_age_seconds; returns their IDs"""
+    cutoff = time.time() - max_age_seconds
+    removed = []
+    for game_id, path, stat in stored_games():
+        if game_id == DEFAULT_GAME_ID or stat.st_mtime >= cutoff:
+            continue
+        with game_lock(game_id):
+            try:
+                if path.stat().st_mtime >= cutoff:
+                    continue
+                path.unlink()
+            except FileNotFoundError:
+                continue
+        forget_game_state(path)
+        forget_game_lock(game_id)
+        removed.append(game_id)
+    return removed
+
+@app.route('/games', methods=['GET'])
+def list_games():
+    """
+    List the stored games, most recently saved first
+    Response: { "success": bool, "games": [{ "game_id": str, "bytes": int, "updated_at": float }, ...] }
+    """
+    games = sorted(stored_games(), key=lambda game: game[2].st_mtime, reverse=True)
+    return jsonify({
+        "success": True,
+        "games": [{"game_id": game_id, "bytes": stat.st_size, "updated_at": stat.st_mtime}
+                  for game_id, _, stat in games]
+    }), 200
+
+@app.route('/games', methods=['POST'])
+def create_game():
+    """
+    Create a game, optionally with an initial state; stale games are collected first
+    Request body: { "game_id": str, "gameState": string (JSON string) }, both optional
+    Response: { "success": bool, "game_id": str, "message": str }
+    Without "game_id" one is generated; an ID already in use gets 409. Until
+    a state is saved, /load-game-state?game_id=<id> answers 404 as for a new game
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        if request.args.get('game_id') is None and data.get('game_id') is None:
+            game_id = uuid.uuid4().hex[:12]
+        else:
+            game_id, error = request_game_id(data)
+            if error:
+                return jsonify({"success": False, "game_id": None, "message": error}), 400
+        
+        collect_stale_games(GAME_TTL_SECONDS)
+        path = game_state_path(game_id)
+        with game_lock(game_id):
+            if path.exists():
+                return jsonify({
+                    "success": False,
+                    "game_id": game_id,
+                    "message": f"Game already exists: {game_id}"
+                }), 409
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.touch()
         
-        # Get output from test results (captured during first test execution)
-        output = test_results.get("output", "")
+        if data.get('gameState') is not None:
+            write_game_state(game_id, data['gameState'])
         
         return jsonify({
             "success": True,
-            "valid": test_results["passed"],
-            "output": output,
-            "error": None if test_results["passed"] else test_results.get("error_message", test_results["message"]),
-            "test_result": {
-                "message": test_results["message"],
-                "tests": test_results["tests"]
-            }
-        }), 200
+            "game_id": game_id,
+            "message": "Game created successfully"
+        }), 201
         
     except Exception as e:
         return jsonify({
             "success": False,
-            "valid": False,
-            "output": "",
-            "error": f"Server error: {str(e)}"
+            "game_id": None,
+            "message": f"Error creating game: {str(e)}"
         }), 500
 
+@app.route('/games/gc', methods=['POST'])
+def collect_games():
+    """
+    Delete games (never the default one) that haven't been saved recently
+    Request body: { "max_age_seconds": float } (optional, defaults to GAME_TTL_SECONDS)
+    Response: { "success": bool, "removed": [game_id, ...] }
+    A max_age_seconds below GAME_TTL_SECONDS needs ADMIN_TOKEN in an
+    X-Admin-Token header; without one, anyone could delete every game
+    """
+    data = request.get_json(silent=True) or {}
+    max_age = data.get('max_age_seconds', GAME_TTL_SECONDS)
+    if isinstance(max_age, bool) or not isinstance(max_age, (int, float)) or max_age < 0:
+        return jsonify({"success": False, "removed": [], "message": "max_age_seconds must be a non-negative number"}), 400
+    if max_age < GAME_TTL_SECONDS and not is_admin_request():
+        return jsonify({
+            "success": False,
+            "removed": [],
+            "message": f"max_age_seconds below {GAME_TTL_SECONDS:g} requires the admin token"
+        }), 403
+    return jsonify({"success": True, "removed": collect_stale_games(max_age)}), 200
+
 @app.route('/save-game-state', methods=['POST'])
 def save_game_state():
     """
-    Save game state to game_state.json file
-    Request body: { "gameState": string (JSON string) }
+    Save game state to game_state.json file, or to game <game_id>'s file
+    Request body: { "gameState": string (JSON string), "game_id": str }
     Response: { "success": bool, "message": str }
+    game_id (also accepted as a query parameter) defaults to the default game
     """
     try:
         data = request.get_json()
@@ -187,6 +586,13 @@ def save_game_state():
                 "message": "No data provided"
             }), 400
         
+        game_id, error = request_game_id(data)
+        if error:
+            return jsonify({
+                "success": False,
+                "message": error
+            }), 400
+        
         game_state = data.get('gameState')
         
         if game_state is None:
@@ -197,13 +603,7 @@ def save_game_state():
         
         # gameState is already a JSON string from the frontend
         # Write it directly to the file
-        with open(GAME_STATE_FILE, 'w') as f:
-            if isinstance(game_state, str):
-                # It's already a JSON string, write it as-is
-                f.write(game_state)
-            else:
-                # It's an object, stringify it
-                json.dump(game_state, f, indent=2)
+        write_game_state(game_id, game_state)
         
         return jsonify({
             "success": True,
@@ -216,39 +616,123 @@ def save_game_state():
             "message": f"Error saving game state: {str(e)}"
         }), 500
 
+def game_state_entry(path: Path) -> Optional[dict]:
+    """
+    The validated /load-game-state response body for a game state file, or None
+    if there is no file or it is empty (a created game with no state saved yet). Entries are reused until the file's mtime or size
+    changes, so polling an unchanged game costs a stat() rather than a read,
+    a json.loads and a re-encode
+    Returns { "valid": bool, "etag": str, "body": bytes, "encoded": { encoding: bytes } }
+    """
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        with _game_state_lock:
+            _game_state_cache.pop(path, None)
+        return None
+    
+    if not stat.st_size:
+        return None
+    
+    version = (stat.st_mtime_ns, stat.st_size)
+    with _game_state_lock:
+        entry = _game_state_cache.get(path)
+        if entry is not None and entry["version"] == version:
+            return entry
+    
+    # Read the file as a string (it contains a JSON string)
+    with open(path, 'rb') as f:
+        raw = f.read()
+    game_state = raw.decode()
+    
+    # Validate it's valid JSON
+    try:
+        json.loads(game_state)
+        valid = True
+    except json.JSONDecodeError:
+        valid = False
+    
+    entry = {
+        "version": version,
+        "valid": valid,
+        "etag": hashlib.sha256(raw).hexdigest()[:32],
+        "body": json.dumps({
+            "success": True,
+            "gameState": game_state,
+            "message": "Game state loaded successfully"
+        }).encode(),
+        "encoded": {}
+    }
+    with _game_state_lock:
+        _game_state_cache[path] = entry
+    return entry
+
+def forget_game_state(path: Path) -> None:
+    """Drop a game state file's cached response after writing or deleting it"""
+    with _game_state_lock:
+        _game_state_cache.pop(path, None)
+
+def conditional_json_response(entry: dict) -> Response:
+    """
+    A 200 with entry's body, compressed if the client accepts gzip or deflate,
+    or a bodiless 304 if the client's If-None-Match already has this version
+    """
+    if request.if_none_match.contains_weak(entry["etag"]):
+        response = Response(status=304)
+    else:
+        body = entry["body"]
+        encoding = request.accept_encodings.best_match(list(COMPRESSORS)) if len(body) >= COMPRESS_MIN_BYTES else None
+        if encoding:
+            with _game_state_lock:
+                encoded = entry["encoded"].get(encoding)
+            if encoded is None:
+                encoded = COMPRESSORS[encoding](body)
+                with _game_state_lock:
+                    entry["encoded"][encoding] = encoded
+            body = encoded
+        response = Response(body, status=200, mimetype="application/json")
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(entry["etag"], weak=True)
+    response.headers["Vary"] = "Accept-Encoding"
+    # Let clients keep the state but revalidate it on every poll
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
 @app.route('/load-game-state', methods=['GET'])
 def load_game_state():
     """
-    Load game state from game_state.json file
+    Load game state from game_state.json file, or from game <game_id>'s file
+    (?game_id=<id>; without it the default game is loaded)
     Response: { "success": bool, "gameState": string (JSON string), "message": str }
+    Sends an ETag: a request whose If-None-Match matches it gets 304 with no
+    body. Bodies are gzip- or deflate-compressed if the client accepts it
     """
     try:
-        if not GAME_STATE_FILE.exists():
+        game_id, error = request_game_id()
+        if error:
+            return jsonify({
+                "success": False,
+                "gameState": None,
+                "message": error
+            }), 400
+        
+        entry = game_state_entry(game_state_path(game_id))
+        if entry is None:
             return jsonify({
                 "success": False,
                 "gameState": None,
                 "message": "No saved game state found"
             }), 404
         
-        # Read the file as a string (it contains a JSON string)
-        with open(GAME_STATE_FILE, 'r') as f:
-            game_state = f.read()
-        
-        # Validate it's valid JSON
-        try:
-            json.loads(game_state)
-        except json.JSONDecodeError:
+        if not entry["valid"]:
             return jsonify({
                 "success": False,
                 "gameState": None,
                 "message": "Invalid JSON in game state file"
             }), 400
         
-        return jsonify({
-            "success": True,
-            "gameState": game_state,
-            "message": "Game state loaded successfully"
-        }), 200
+        return conditional_json_response(entry)
         
     except Exception as e:
         return jsonify({
@@ -260,12 +744,23 @@ def load_game_state():
 @app.route('/reset-game-state', methods=['POST'])
 def reset_game_state():
     """
-    Reset/delete game_state.json file
+    Reset/delete game_state.json file, or game <game_id>'s file (?game_id=<id>)
     Response: { "success": bool, "message": str }
     """
     try:
-        if GAME_STATE_FILE.exists():
-            GAME_STATE_FILE.unlink()
+        game_id, error = request_game_id(request.get_json(silent=True))
+        if error:
+            return jsonify({
+                "success": False,
+                "message": error
+            }), 400
+        
+        path = game_state_path(game_id)
+        if path.exists():
+            with game_lock(game_id):
+                path.unlink(missing_ok=True)
+            forget_game_lock(game_id)
+        forget_game_state(path)
         
         return jsonify({
             "success": True,
@@ -278,18 +773,212 @@ def reset_game_state():
             "message": f"Error resetting game state: {str(e)}"
         }), 500
 
+# Startup cost and the latency of the first graded submission, reported by /health
+STARTUP_TIMINGS = {"startup_ms": None, "first_request_ms": None}
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_first_request(response):
+    if STARTUP_TIMINGS["first_request_ms"] is None and request.path == '/test-code' and response.status_code == 200:
+        STARTUP_TIMINGS["first_request_ms"] = round((time.perf_counter() - g.request_started) * 1000, 2)
+    return response
+
+@app.after_request
+def record_request_metrics(response):
+    # Only routed requests, so unknown URLs can't add label values; a streamed
+    # batch response is timed up to its first byte
+    if request.url_rule is not None and "request_started" in g:
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, route=request.url_rule.rule,
+                                method=request.method, status=response.status_code)
+    return response
+
+def check_reference_solutions() -> bool:
+    """
+    Grade every reference solution with its own grader before serving
+    Returns False if any fail and VERIFY_REFERENCES is "strict"
+    """
+    if VERIFY_REFERENCES == "off":
+        return True
+    failures = verify_reference_solutions()
+    for question_id, index, result in failures:
+        print(f"WARNING: reference solution {index + 1} for {question_id} fails its grader: {result['message']}")
+    return not (failures and VERIFY_REFERENCES == "strict")
+
+@app.before_request
+def reject_large_requests():
+    # Checked before the route runs so the route's own error handling doesn't
+    # turn the 413 into a 500
+    if request.content_length is not None and request.content_length > MAX_REQUEST_BYTES:
+        abort(413)
+
+@app.errorhandler(413)
+def request_too_large(error):
+    return jsonify({
+        "success": False,
+        "error": f"Request body too large (maximum is {MAX_REQUEST_BYTES} bytes)"
+    }), 413
+
 @app.route('/health', methods=['GET'])
 def health():
-    """Health check endpoint"""
-    return jsonify({"status": "ok"}), 200
+    """
+    Health check endpoint
+    Response: { "status": "ok", "startup": { "startup_ms": float, "first_request_ms": float | null, "graders_prepared": int } }
+    """
+    return jsonify({
+        "status": "ok",
+        "startup": {**STARTUP_TIMINGS, "graders_prepared": len(TEST_REGISTRY.prepare_ms)}
+    }), 200
+
+def profiling_requested() -> bool:
+    """Whether this request should run under the profiler (see PROFILE_ROUTES and PROFILE_TOKEN)"""
+    if request.url_rule is not None and request.url_rule.rule in PROFILE_ROUTES:
+        return True
+    token = request.headers.get("X-Profile-Token") or request.args.get("profile")
+    return bool(PROFILE_TOKEN and token and hmac.compare_digest(token, PROFILE_TOKEN))
+
+@app.before_request
+def start_profiler():
+    if profiling_requested() and _profile_lock.acquire(blocking=False):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def write_profile(response):
+    """
+    Stop the request's profiler and write <name>.prof (load it with pstats or
+    snakeviz) and <name>.json (route, question_id and timings) to PROFILE_DIR,
+    plus <name>.grader.prof for a submission profiled where it was graded
+    """
+    profiler = g.get("profiler")
+    if profiler is None:
+        return response
+    profiler.disable()
+    try:
+        wall_ms = round((time.perf_counter() - g.request_started) * 1000, 3)
+        data = request.get_json(silent=True)
+        question_id = data.get("question_id") if isinstance(data, dict) else None
+        name = "-".join(part for part in (
+            time.strftime("%Y%m%d-%H%M%S"),
+            re.sub(r"[^A-Za-z0-9_]+", "_", request.path).strip("_"),
+            re.sub(r"[^A-Za-z0-9_]+", "_", question_id) if isinstance(question_id, str) else None,
+            f"{time.time_ns() % 10**9:09d}"
+        ) if part)
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(PROFILE_DIR / f"{name}.prof")
+        grader_profile = g.get("grader_profile")
+        if grader_profile is not None:
+            (PROFILE_DIR / f"{name}.grader.prof").write_bytes(grader_profile)
+            response.headers["X-Grader-Profile"] = f"{name}.grader.prof"
+        with open(PROFILE_DIR / f"{name}.json", 'w') as f:
+            json.dump({
+                "route": request.url_rule.rule if request.url_rule is not None else request.path,
+                "method": request.method,
+                "status": response.status_code,
+                "question_id": question_id,
+                "wall_ms": wall_ms,
+                "profile": f"{name}.prof",
+                "grader_profile": f"{name}.grader.prof" if grader_profile is not None else None
+            }, f, indent=2)
+        response.headers["X-Profile"] = f"{name}.prof"
+    except Exception as e:
+        print(f"WARNING: could not write request profile: {str(e)}")
+    return response
+
+@app.teardown_request
+def stop_profiler(error):
+    # Runs even when the request failed before write_profile could
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        _profile_lock.release()
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Request latency, per-question grading latency and outcomes, grading load
+    and game state file metrics, in the Prometheus text format
+    """
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+STARTUP_TIMINGS["startup_ms"] = round((time.perf_counter() - _started) * 1000, 2)
+
+def start_grading() -> None:
+    """Check the reference solutions, then start the grading executor before serving"""
+    if not check_reference_solutions():
+        sys.exit("Refusing to start: reference solutions fail their graders (GRADING_VERIFY_REFERENCES=strict)")
+    grading.get_executor()
+
+def fit_admission_to_threads() -> None:
+    """
+    Shrink the grading queue if SERVER_THREADS was set too low for it, so
+    submissions are refused with a 429 before they can occupy every request
+    thread and stall /health and the game state routes
+    """
+    admission = grading.admission
+    available = SERVER_THREADS - RESERVED_THREADS
+    if available < admission.capacity:
+        sys.exit(f"Refusing to start: SERVER_THREADS must be at least {admission.capacity + RESERVED_THREADS} "
+                 f"({admission.capacity} grading workers + {RESERVED_THREADS} for other requests)")
+    if admission.limit > available:
+        print(f"WARNING: SERVER_THREADS={SERVER_THREADS} leaves room for {available} grading requests; "
+              f"limiting the grading queue to {available - admission.capacity} (GRADING_MAX_QUEUE={admission.max_queue})")
+        admission.max_queue = available - admission.capacity
+
+def serve_production(host: str, port: int) -> None:
+    """
+    Serve with waitress: SERVER_THREADS request threads, idle keep-alive
+    connections closed after KEEPALIVE_SECONDS and bodies capped at
+    MAX_REQUEST_BYTES. Grading runs on the executor's worker processes, so
+    request threads only wait on it and the other routes stay responsive.
+    """
+    fit_admission_to_threads()
+    start_grading()
+    if waitress is None:
+        print("WARNING: waitress is not installed (pip install -r requirements.txt); using Flask's threaded server")
+        app.run(host=host, port=port, threaded=True, debug=False, use_reloader=False)
+        return
+    print(f"Serving with waitress: {SERVER_THREADS} threads, {grading.GRADING_BACKEND} grading backend")
+    waitress.serve(
+        app,
+        host=host,
+        port=port,
+        threads=SERVER_THREADS,
+        channel_timeout=KEEPALIVE_SECONDS,
+        max_request_body_size=MAX_REQUEST_BYTES,
+        ident="monopoly-code-server"
+    )
 
 if __name__ == '__main__':
-    print("Starting Monopoly Code Testing Server on http://localhost:5001")
+    parser = argparse.ArgumentParser(description="Monopoly Code Testing Server")
+    parser.add_argument("--production", action="store_true",
+                        help="serve with waitress instead of the debug server and its reloader")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5001)
+    options = parser.parse_args()
+
+    print(f"Starting Monopoly Code Testing Server on http://localhost:{options.port}")
+    print(f"Loaded {len(TEST_REGISTRY)} question specs in {STARTUP_TIMINGS['startup_ms']} ms")
     print("Endpoints:")
     print("  POST /test-code - Test Python code")
+    print("  GET  /test-code/jobs/<job_id> - Poll an asynchronous /test-code submission")
+    print("  POST /test-code/batch - Test many code submissions in parallel")
+    print("  GET  /grading-stats - Grading resource usage per question")
     print("  POST /save-game-state - Save game state to file")
     print("  GET  /load-game-state - Load game state from file")
     print("  POST /reset-game-state - Reset game state file")
+    print("  GET  /games - List stored games (save/load/reset take ?game_id=<id>)")
+    print("  POST /games - Create a game")
+    print("  POST /games/gc - Remove games not saved recently")
     print("  GET  /health - Health check")
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    print("  GET  /metrics - Prometheus metrics")
+    if options.production:
+        serve_production(options.host, options.port)
+    else:
+        # Start the grading executor in the serving process (not the reloader's watcher)
+        if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+            start_grading()
+        app.run(host=options.host, port=options.port, debug=True)
 
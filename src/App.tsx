@@ -13,7 +13,10 @@ import { getPropertyById, getPropertyByPosition } from "./data/properties";
 import { getQuestionByPropertyId, getQuestionById } from "./data/questions";
 import "./App.css";
 
-const STORAGE_KEY = "monopoly_game_state";
+// ?game=<id> in the page URL selects which of the server's stored games to play
+const GAME_ID = new URLSearchParams(window.location.search).get("game");
+const GAME_QUERY = GAME_ID ? `?game_id=${encodeURIComponent(GAME_ID)}` : "";
+const STORAGE_KEY = GAME_ID ? `monopoly_game_state_${GAME_ID}` : "monopoly_game_state";
 const BACKEND_URL = "http://localhost:5001";
 
 interface GameState {
@@ -99,7 +102,7 @@ function App() {
         const timeoutId = setTimeout(() => controller.abort(), 3000);
 
         try {
-          const response = await fetch(`${BACKEND_URL}/load-game-state`, {
+          const response = await fetch(`${BACKEND_URL}/load-game-state${GAME_QUERY}`, {
             signal: controller.signal,
           });
           clearTimeout(timeoutId);
@@ -174,7 +177,7 @@ function App() {
 
     // Save to game_state.json file (don't block on this)
     const gameStateJson = gameInstance.toJSON();
-    fetch(`${BACKEND_URL}/save-game-state`, {
+    fetch(`${BACKEND_URL}/save-game-state${GAME_QUERY}`, {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
@@ -355,7 +358,7 @@ function App() {
 
       let response;
       try {
-        response = await fetch(`${BACKEND_URL}/load-game-state`, {
+        response = await fetch(`${BACKEND_URL}/load-game-state${GAME_QUERY}`, {
           signal: controller.signal,
         });
         clearTimeout(timeoutId);
@@ -422,7 +425,7 @@ function App() {
     // Reset game state file on backend (don't block on this)
     const controller = new AbortController();
     const timeoutId = setTimeout(() => controller.abort(), 3000);
-    fetch(`${BACKEND_URL}/reset-game-state`, {
+    fetch(`${BACKEND_URL}/reset-game-state${GAME_QUERY}`, {
       method: "POST",
       signal: controller.signal,
     })
@@ -850,6 +853,8 @@ function App() {
         onClose={handleDecline}
         onPurchase={handlePurchase}
         onDecline={handleDecline}
+        teamId={gameState.currentTeam.id}
+        gameId={GAME_ID}
       />
       <CardModal
         isOpen={cardModal.isOpen}
@@ -21,6 +21,8 @@ interface PurchaseModalProps {
   onPurchase: () => void;
   onDecline: () => void;
   backendUrl?: string;
+  teamId?: number;
+  gameId?: string | null;
 }
 
 interface TestResult {
@@ -43,6 +45,8 @@ export const PurchaseModal: React.FC<PurchaseModalProps> = ({
   onPurchase,
   onDecline,
   backendUrl = "http://localhost:5001",
+  teamId,
+  gameId,
 }) => {
   const editorRef = useRef<HTMLDivElement>(null);
   const viewRef = useRef<EditorView | null>(null);
@@ -142,6 +146,8 @@ export const PurchaseModal: React.FC<PurchaseModalProps> = ({
           body: JSON.stringify({
             code: selectedAnswer,
             question_id: question?.question_id || "",
+            team_id: teamId,
+            game_id: gameId ?? undefined,
           }),
         });
 
@@ -183,6 +189,8 @@ export const PurchaseModal: React.FC<PurchaseModalProps> = ({
         body: JSON.stringify({
           code,
           question_id: question?.question_id || "",
+          team_id: teamId,
+          game_id: gameId ?? undefined,
         }),
       });
 
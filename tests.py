@@ -1,1566 +1,1374 @@
 """
 Test suite for Monopoly game code challenges
-Each question has specific test cases that validate the code
+Each question's test cases are declared in src/data/question_tests.json and run
+by a single grading engine that validates the submitted code
 """
 
+import ast
+import builtins
+import copy
+import ctypes
+import errno
+import functools
+import hashlib
+import importlib
+import json
 import sys
 import io
-from contextlib import redirect_stdout, redirect_stderr
-from typing import Dict, List, Tuple, Any
+import math
+import os
+import pathlib
+import posixpath
+import re
+import signal
+import tempfile
+import threading
+import time
+import types
+from contextlib import contextmanager
+from collections.abc import Mapping
+from contextvars import ContextVar
+from pathlib import Path
+from types import CodeType
+from typing import Callable, Dict, Iterator, List, Tuple, Any, Optional
 
-def test_oriental_q1(code: str) -> Dict[str, Any]:
+try:
+    import resource
+except ImportError:  # Windows has no rlimits; only the thread-level limits apply
+    resource = None
+
+# Filename shown in tracebacks and syntax errors raised by submitted code
+SUBMISSION_FILENAME = "<submission>"
+
+@functools.lru_cache(maxsize=64)
+def parse_submission(code: str) -> ast.Module:
     """
-    Test: Conditional expression for age check
-    Tests that code correctly uses conditional expression to print 'adult' or 'minor'
+    Parse a submission once; the pre-screen, the graders and the compiler share the tree
+    Raises SyntaxError, which run_test() turns into a failed result for all graders
     """
-    test_cases = [
-        {"age": 20, "expected": "adult"},
-        {"age": 18, "expected": "adult"},
-        {"age": 15, "expected": "minor"},
-        {"age": 0, "expected": "minor"},
-        {"age": 25, "expected": "adult"},
-    ]
-    
-    results = {}
-    all_passed = True
-    first_output = ""  # Capture output from first test for display
-    
-    for i, test_case in enumerate(test_cases):
-        age = test_case["age"]
-        expected = test_case["expected"]
-        
-        try:
-            # Create a new namespace with the test variable
-            namespace = {"age": age}
-            
-            # Capture stdout
-            f = io.StringIO()
-            with redirect_stdout(f), redirect_stderr(f):
-                exec(code, namespace)
-            output = f.getvalue().strip()
-            
-            # Save first output for display
-            if i == 0:
-                first_output = output
-            
-            passed = output == expected
-            results[f"test_{i+1}_age_{age}"] = passed
-            if not passed:
-                all_passed = False
-                
-        except Exception as e:
-            results[f"test_{i+1}_age_{age}"] = False
-            all_passed = False
-            if i == 0:
-                first_output = f"Error: {str(e)}"
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly uses a conditional expression." if all_passed else "Some tests failed. Make sure your code uses a conditional expression (ternary operator) and prints 'adult' for age >= 18, 'minor' otherwise."
-    }
+    return ast.parse(code, SUBMISSION_FILENAME)
 
-def test_vermont_q1(code: str) -> Dict[str, Any]:
+def compile_submission(code: str) -> CodeType:
     """
-    Test: Boolean expression in a range
-    Tests that code correctly sets is_valid based on x being between 1 and 10 (inclusive)
+    Compile a submission to a code object once so every test case can reuse it
+    Raises SyntaxError, which run_test() turns into a failed result for all graders
     """
-    test_cases = [
-        {"x": 5, "expected": True},
-        {"x": 1, "expected": True},
-        {"x": 10, "expected": True},
-        {"x": 15, "expected": False},
-        {"x": 0, "expected": False},
-        {"x": 11, "expected": False},
-        {"x": -5, "expected": False},
-    ]
-    
-    results = {}
-    all_passed = True
-    first_output = ""  # Capture output from first test for display
-    
-    for i, test_case in enumerate(test_cases):
-        x = test_case["x"]
-        expected = test_case["expected"]
-        
-        try:
-            # Create a new namespace with the test variable
-            namespace = {"x": x}
-            
-            # Capture stdout
-            f = io.StringIO()
-            with redirect_stdout(f), redirect_stderr(f):
-                exec(code, namespace)
-            output = f.getvalue().strip()
-            
-            # Save first output for display
-            if i == 0:
-                first_output = output
-            
-            # Check if is_valid was set correctly (handle both snake_case and camelCase)
-            is_valid = namespace.get("is_valid", None)
-            isValid = namespace.get("isValid", None)
-            variable_value = is_valid if is_valid is not None else isValid
-            
-            # Check printed output (should print True or False)
-            printed_output = output.lower()
-            expected_str = str(expected).lower()
-            
-            # Pass if:
-            # 1. Variable is set correctly (is_valid or isValid), OR
-            # 2. Printed output matches expected (True/False)
-            passed = (variable_value == expected) or (expected_str in printed_output)
-            results[f"test_{i+1}_x_{x}"] = passed
-            if not passed:
-                all_passed = False
-                
-        except Exception as e:
-            results[f"test_{i+1}_x_{x}"] = False
-            all_passed = False
-            if i == 0:
-                first_output = f"Error: {str(e)}"
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly checks the range and prints the result." if all_passed else "Some tests failed. Make sure your code checks if x is between 1 and 10 (inclusive) and prints True or False."
-    }
+    return compile(parse_submission(code), SUBMISSION_FILENAME, "exec")
+
+# Output buffer of the submission running in the current thread/context, if any
+_capture_target: ContextVar[Optional[io.TextIOBase]] = ContextVar("capture_target", default=None)
 
-def test_connecticut_q1(code: str) -> Dict[str, Any]:
+# Most bytes of output the submission running in the current context may print
+# (set by enforce_limits(); None means unlimited)
+_output_limit: ContextVar[Optional[int]] = ContextVar("output_limit", default=None)
+_capture_install_lock = threading.Lock()
+
+class _CapturingStream(io.TextIOBase):
     """
-    Test: Loop over a list
-    Tests that code correctly loops through nums and prints each number on its own line
+    Stand-in for sys.stdout/sys.stderr that routes writes to the capture buffer of
+    the submission running in the current context, and everything else to the
+    real stream. Lets concurrent graders capture output without swapping globals.
     """
-    test_cases = [
-        {"nums": [1, 2, 3], "expected": "1\n2\n3"},
-        {"nums": [5], "expected": "5"},
-        {"nums": [10, 20, 30, 40], "expected": "10\n20\n30\n40"},
-        {"nums": [0, 1], "expected": "0\n1"},
-    ]
-    
-    results = {}
-    all_passed = True
-    first_output = ""  # Capture output from first test for display
-    
-    for i, test_case in enumerate(test_cases):
-        nums = test_case["nums"]
-        expected = test_case["expected"]
-        
-        try:
-            # Create a new namespace with the test variable
-            namespace = {"nums": nums}
-            
-            # Capture stdout
-            f = io.StringIO()
-            with redirect_stdout(f), redirect_stderr(f):
-                exec(code, namespace)
-            output = f.getvalue()
-            
-            # Save first output for display
-            if i == 0:
-                first_output = output.rstrip()
-            
-            # Normalize output (remove trailing newline)
-            output_normalized = output.rstrip()
-            expected_normalized = expected.rstrip()
-            
-            passed = output_normalized == expected_normalized
-            results[f"test_{i+1}"] = passed
-            if not passed:
-                all_passed = False
-                
-        except Exception as e:
-            results[f"test_{i+1}"] = False
-            all_passed = False
-            if i == 0:
-                first_output = f"Error: {str(e)}"
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly loops through the list and prints each number." if all_passed else "Some tests failed. Make sure your code uses a for loop to iterate through nums and prints each number on its own line."
-    }
 
-def test_mediterranean_q1(code: str) -> Dict[str, Any]:
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text: str) -> int:
+        target = _capture_target.get()
+        if target is None:
+            return self._stream.write(text)
+        return target.write(text)
+
+    def flush(self) -> None:
+        if _capture_target.get() is None:
+            self._stream.flush()
+
+    # io.TextIOBase defines these itself (as None, False or raising), so
+    # __getattr__ alone would never reach the real stream's
+    @property
+    def encoding(self) -> Optional[str]:
+        return self._stream.encoding
+
+    @property
+    def errors(self) -> Optional[str]:
+        return self._stream.errors
+
+    @property
+    def newlines(self) -> Any:
+        return self._stream.newlines
+
+    @property
+    def buffer(self) -> Any:
+        return self._stream.buffer
+
+    def fileno(self) -> int:
+        return self._stream.fileno()
+
+    def isatty(self) -> bool:
+        return self._stream.isatty()
+
+    def writable(self) -> bool:
+        return self._stream.writable()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._stream, name)
+
+def _install_capturing_streams() -> None:
+    """Wrap sys.stdout and sys.stderr once (again if something replaced them)"""
+    with _capture_install_lock:
+        if not isinstance(sys.stdout, _CapturingStream):
+            sys.stdout = _CapturingStream(sys.stdout)
+        if not isinstance(sys.stderr, _CapturingStream):
+            sys.stderr = _CapturingStream(sys.stderr)
+
+# Counters ("exec_calls", "cases_run") of the run_test() call in the current context
+_usage_counters: ContextVar[Optional[Dict[str, int]]] = ContextVar("usage_counters", default=None)
+
+def _count(counter: str) -> None:
+    counters = _usage_counters.get()
+    if counters is not None:
+        counters[counter] += 1
+
+def _byte_length(text: str) -> int:
+    return len(text) if text.isascii() else len(text.encode("utf-8", "surrogatepass"))
+
+class _BoundedOutput(io.TextIOBase):
     """
-    Test: Store and print a float
-    Tests that code stores 7 in x and prints it (should output 7.0)
+    Capture buffer holding at most `limit` bytes of a submission's output
+    The write that would go past the limit raises OutputLimitExceeded instead,
+    carrying the head and tail of everything printed, so memory stays bounded
+    however much a submission prints.
     """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
-    try:
-        namespace = {}
-        f = io.StringIO()
-        with redirect_stdout(f), redirect_stderr(f):
-            exec(code, namespace)
-        output = f.getvalue().strip()
-        first_output = output
-        
-        # Check if x exists and equals 7.0
-        x_value = namespace.get("x", None)
-        passed = (output == "7.0") and (x_value == 7.0)
-        results["test_1"] = passed
-        if not passed:
-            all_passed = False
-    except Exception as e:
-        results["test_1"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly stores 7 in x and prints 7.0." if all_passed else "Test failed. Make sure you store 7 in a variable named x and print it. The output should be 7.0."
-    }
 
-def test_baltic_q1(code: str) -> Dict[str, Any]:
+    def __init__(self, limit: Optional[int] = None):
+        self.limit = limit
+        self.size = 0
+        self._buffer = io.StringIO()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        size = _byte_length(text)
+        if self.limit is not None and self.size + size > self.limit:
+            raise OutputLimitExceeded(f"Output limit exceeded ({self.limit} bytes)",
+                                      self._truncated(text, self.size + size))
+        self.size += size
+        return self._buffer.write(text)
+
+    def _truncated(self, text: str, total: int) -> str:
+        # Slice before concatenating: text may be one enormous string
+        written = self._buffer.getvalue()
+        half = self.limit // 2
+        head = written[:half] if len(written) >= half else written + text[:half - len(written)]
+        tail = text[-half:] if len(text) >= half else written[-(half - len(text)):] + text
+        dropped = total - _byte_length(head) - _byte_length(tail)
+        return f"{head}\n... [{dropped} bytes of output truncated] ...\n{tail}"
+
+    def getvalue(self) -> str:
+        return self._buffer.getvalue()
+
+class _VirtualFile:
     """
-    Test: Format a string with a variable
-    Tests that code stores name and prints "Hello, <name>"
+    Behaviour shared by in-memory text and binary files: mode checks, and writing
+    the contents back to the VirtualFS when the file is closed
     """
-    test_cases = [
-        {"name": "Alice", "expected": "Hello, Alice"},
-        {"name": "Bob", "expected": "Hello, Bob"},
-        {"name": "Charlie", "expected": "Hello, Charlie"},
-    ]
-    
-    results = {}
-    all_passed = True
-    first_output = ""
-    
-    for i, test_case in enumerate(test_cases):
-        name = test_case["name"]
-        expected = test_case["expected"]
-        
-        try:
-            namespace = {"name": name}
-            f = io.StringIO()
-            with redirect_stdout(f), redirect_stderr(f):
-                exec(code, namespace)
-            output = f.getvalue().strip()
-            
-            if i == 0:
-                first_output = output
-            
-            passed = output == expected
-            results[f"test_{i+1}_name_{name}"] = passed
-            if not passed:
-                all_passed = False
-        except Exception as e:
-            results[f"test_{i+1}_name_{name}"] = False
-            all_passed = False
-            if i == 0:
-                first_output = f"Error: {str(e)}"
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly formats and prints the greeting." if all_passed else "Some tests failed. Make sure you store a name in a variable and print 'Hello, ' followed by the name."
-    }
 
-def test_st_charles_q1(code: str) -> Dict[str, Any]:
+    def _setup(self, fs: "VirtualFS", name: str, mode: str) -> None:
+        self.name = name
+        self.mode = mode
+        self._fs = fs
+        self._can_read = "r" in mode or "+" in mode
+        self._can_write = "r" not in mode or "+" in mode
+        if "a" in mode:
+            self.seek(0, io.SEEK_END)
+
+    def _check(self, allowed: bool, what: str) -> None:
+        if not allowed:
+            raise io.UnsupportedOperation(f"not {what}")
+
+    def readable(self) -> bool:
+        return self._can_read
+
+    def writable(self) -> bool:
+        return self._can_write
+
+    def read(self, size=-1):
+        self._check(self._can_read, "readable")
+        return super().read(size)
+
+    def readline(self, size=-1):
+        self._check(self._can_read, "readable")
+        return super().readline(size)
+
+    def readlines(self, hint=-1):
+        self._check(self._can_read, "readable")
+        return super().readlines(hint)
+
+    def __next__(self):
+        self._check(self._can_read, "readable")
+        return super().__next__()
+
+    def write(self, data):
+        self._check(self._can_write, "writable")
+        if "a" in self.mode:
+            self.seek(0, io.SEEK_END)
+        return super().write(data)
+
+    def writelines(self, lines) -> None:
+        for line in lines:
+            self.write(line)
+
+    def close(self) -> None:
+        if not self.closed and self._can_write:
+            self._fs.files[self.name] = self.getvalue()
+        super().close()
+
+class _VirtualTextFile(_VirtualFile, io.StringIO):
+    def __init__(self, fs: "VirtualFS", name: str, content: str, mode: str):
+        io.StringIO.__init__(self, content)
+        self._setup(fs, name, mode)
+
+class _VirtualBinaryFile(_VirtualFile, io.BytesIO):
+    def __init__(self, fs: "VirtualFS", name: str, content: bytes, mode: str):
+        io.BytesIO.__init__(self, content)
+        self._setup(fs, name, mode)
+
+class VirtualFS:
     """
-    Test: Define a square function
-    Tests that code defines square(n) function that returns n squared
+    In-memory filesystem for one execution, seeded with {filename: contents}
+    Its open() replaces the builtin for the submission, and its modules() stand in
+    for io and pathlib, so file questions never touch disk and graders can
+    inspect the resulting files directly. (os is kept out by the default prescreen.)
     """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
-    try:
-        namespace = {}
-        f = io.StringIO()
-        with redirect_stdout(f), redirect_stderr(f):
-            exec(code, namespace)
-        output = f.getvalue().strip()
-        first_output = output if output else "No output (function defined)"
-        
-        # Check if square function exists
-        square_func = namespace.get("square", None)
-        if square_func is None:
-            results["test_1_function_exists"] = False
-            all_passed = False
+
+    def __init__(self, files: Optional[Dict[str, Any]] = None):
+        self.files: Dict[str, Any] = {self._normalize(name): content for name, content in (files or {}).items()}
+
+    def modules(self) -> Dict[str, Any]:
+        """Stand-ins for the io and pathlib modules whose file access uses these files"""
+        fs = self
+
+        class VirtualPath(pathlib.PurePosixPath):
+            def open(self, mode="r", buffering=-1, encoding=None, errors=None, newline=None):
+                return fs.open(self, mode, buffering, encoding, errors, newline)
+
+            def read_text(self, encoding=None, errors=None):
+                with self.open("r") as f:
+                    return f.read()
+
+            def read_bytes(self):
+                with self.open("rb") as f:
+                    return f.read()
+
+            def write_text(self, data, encoding=None, errors=None, newline=None):
+                with self.open("w") as f:
+                    return f.write(data)
+
+            def write_bytes(self, data):
+                with self.open("wb") as f:
+                    return f.write(data)
+
+            def exists(self):
+                return fs._normalize(self) in fs.files
+
+            is_file = exists
+
+            def touch(self, mode=0o666, exist_ok=True):
+                if self.exists():
+                    if not exist_ok:
+                        raise FileExistsError(errno.EEXIST, "File exists", str(self))
+                    return
+                fs.files[fs._normalize(self)] = ""
+
+            def unlink(self, missing_ok=False):
+                if fs.files.pop(fs._normalize(self), None) is None and not missing_ok:
+                    raise FileNotFoundError(errno.ENOENT, "No such file or directory", str(self))
+
+        virtual_io = types.ModuleType("io")
+        virtual_io.__dict__.update(io.__dict__)
+        virtual_io.open = fs.open
+        virtual_pathlib = types.ModuleType("pathlib")
+        virtual_pathlib.__dict__.update(pathlib.__dict__)
+        virtual_pathlib.Path = virtual_pathlib.PosixPath = VirtualPath
+        return {"io": virtual_io, "pathlib": virtual_pathlib}
+
+    @staticmethod
+    def _normalize(name: Any) -> str:
+        return posixpath.normpath(os.fspath(name))
+
+    def read_text(self, name: str) -> str:
+        content = self.files[self._normalize(name)]
+        return content.decode() if isinstance(content, bytes) else content
+
+    def open(self, file, mode="r", buffering=-1, encoding=None, errors=None, newline=None, closefd=True, opener=None):
+        name = self._normalize(file)
+        exists = name in self.files
+        if ("r" in mode) and not exists:
+            raise FileNotFoundError(errno.ENOENT, "No such file or directory", os.fspath(file))
+        if "x" in mode and exists:
+            raise FileExistsError(errno.EEXIST, "File exists", os.fspath(file))
+
+        content = self.files.get(name, "") if ("r" in mode or "a" in mode) else ""
+        if "b" in mode:
+            content = content.encode() if isinstance(content, str) else content
+            handle = _VirtualBinaryFile(self, name, content, mode)
         else:
-            # Test the function with various inputs
-            test_cases = [
-                {"n": 2, "expected": 4},
-                {"n": 5, "expected": 25},
-                {"n": 0, "expected": 0},
-                {"n": -3, "expected": 9},
-            ]
-            
-            for i, test_case in enumerate(test_cases):
-                n = test_case["n"]
-                expected = test_case["expected"]
-                try:
-                    result = square_func(n)
-                    passed = result == expected
-                    results[f"test_{i+1}_n_{n}"] = passed
-                    if not passed:
-                        all_passed = False
-                except Exception as e:
-                    results[f"test_{i+1}_n_{n}"] = False
-                    all_passed = False
-    except Exception as e:
-        results["test_1_function_exists"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly defines the square function." if all_passed else "Test failed. Make sure you define a function named square(n) that returns n squared."
-    }
+            content = content.decode() if isinstance(content, bytes) else content
+            handle = _VirtualTextFile(self, name, content, mode)
+        if handle.writable():
+            # Opening for writing creates (or truncates) the file immediately
+            self.files[name] = handle.getvalue()
+        return handle
 
-def test_states_q1(code: str) -> Dict[str, Any]:
+def _make_builtins(output: io.TextIOBase, modules: Dict[str, Any], files: Optional[VirtualFS]) -> Dict[str, Any]:
     """
-    Test: Call a function and store result
-    Tests that code calls greet(name) with "Alex" and stores result in message
+    Builtins for one execution: print() writes straight to its output buffer,
+    imports of the names in modules resolve to those stubs instead of sys.modules,
+    and open(), io and pathlib use the in-memory files when given
     """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
-    # Define a mock greet function
-    def greet(name):
-        return f"Hello, {name}!"
-    
-    try:
-        namespace = {"greet": greet}
-        f = io.StringIO()
-        with redirect_stdout(f), redirect_stderr(f):
-            exec(code, namespace)
-        output = f.getvalue().strip()
-        first_output = output if output else "No output (result stored)"
-        
-        # Check if message variable exists and has correct value
-        message = namespace.get("message", None)
-        expected = "Hello, Alex!"
-        passed = message == expected
-        results["test_1"] = passed
-        if not passed:
-            all_passed = False
-    except Exception as e:
-        results["test_1"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly calls the function and stores the result." if all_passed else "Test failed. Make sure you call greet('Alex') and store the result in a variable named message."
-    }
+    def captured_print(*args, sep=" ", end="\n", file=None, flush=False):
+        builtins.print(*args, sep=sep, end=end, file=output if file is None else file, flush=flush)
+
+    def scoped_import(name, globals=None, locals=None, fromlist=(), level=0):
+        root = name.partition(".")[0]
+        if level != 0 or root not in modules:
+            return builtins.__import__(name, globals, locals, fromlist, level)
+        module = modules[root]
+        if fromlist:
+            # "from a.b import c" wants the submodule itself, not the package
+            for part in name.split(".")[1:]:
+                module = getattr(module, part)
+        return module
 
-def test_virginia_q1(code: str) -> Dict[str, Any]:
+    if files is not None:
+        modules = {**files.modules(), **modules}
+
+    sandbox_builtins = dict(builtins.__dict__)
+    sandbox_builtins["print"] = captured_print
+    if modules:
+        sandbox_builtins["__import__"] = scoped_import
+    if files is not None:
+        sandbox_builtins["open"] = files.open
+    return sandbox_builtins
+
+def run_code(compiled: CodeType, namespace: Dict[str, Any], modules: Optional[Dict[str, Any]] = None,
+             files: Optional[VirtualFS] = None) -> str:
     """
-    Test: Function with default argument
-    Tests that code defines add(a, b=10) function
+    Execute a compiled submission in namespace and return everything it printed
+    Output is captured per execution, so any number of threads can run this at once.
+    modules maps top-level module names to stubs that the submission's imports get;
+    files gives it an in-memory filesystem instead of the real one.
+    Printing more than the active output limit raises OutputLimitExceeded.
     """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
+    output = _BoundedOutput(_output_limit.get())
+    namespace["__builtins__"] = _make_builtins(output, modules or {}, files)
+    _install_capturing_streams()
+    token = _capture_target.set(output)
+    _count("exec_calls")
     try:
-        namespace = {}
-        f = io.StringIO()
-        with redirect_stdout(f), redirect_stderr(f):
-            exec(code, namespace)
-        output = f.getvalue().strip()
-        first_output = output if output else "No output (function defined)"
-        
-        # Check if add function exists
-        add_func = namespace.get("add", None)
-        if add_func is None:
-            results["test_1_function_exists"] = False
-            all_passed = False
-        else:
-            # Test the function with various inputs
-            test_cases = [
-                {"a": 5, "b": 10, "expected": 15},  # Both args
-                {"a": 5, "b": None, "expected": 15},  # Default b
-                {"a": 0, "b": 10, "expected": 10},
-                {"a": 10, "b": None, "expected": 20},  # Default b
-            ]
-            
-            for i, test_case in enumerate(test_cases):
-                a = test_case["a"]
-                b = test_case["b"]
-                expected = test_case["expected"]
-                try:
-                    if b is None:
-                        result = add_func(a)  # Use default
-                    else:
-                        result = add_func(a, b)
-                    passed = result == expected
-                    results[f"test_{i+1}"] = passed
-                    if not passed:
-                        all_passed = False
-                except Exception as e:
-                    results[f"test_{i+1}"] = False
-                    all_passed = False
-    except Exception as e:
-        results["test_1_function_exists"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-    
+        exec(compiled, namespace)
+    finally:
+        _capture_target.reset(token)
+    return output.getvalue()
+
+def syntax_error_result(error: SyntaxError) -> Dict[str, Any]:
+    """Build the failed test result for a submission that does not compile"""
+    message = f"Syntax error on line {error.lineno}: {error.msg}"
     return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly defines the add function with a default argument." if all_passed else "Test failed. Make sure you define a function named add(a, b=10) that returns the sum of a and b."
+        "passed": False,
+        "tests": {"syntax": False},
+        "output": f"Error: {message}",
+        "message": message
     }
 
-def test_st_james_q1(code: str) -> Dict[str, Any]:
-    """
-    Test: Create a list of even numbers
-    Tests that code creates evens list with [0, 2, 4, 6, 8, 10]
-    """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
-    try:
-        namespace = {}
-        f = io.StringIO()
-        with redirect_stdout(f), redirect_stderr(f):
-            exec(code, namespace)
-        output = f.getvalue().strip()
-        first_output = output if output else "No output (list created)"
-        
-        # Check if evens variable exists and has correct value
-        evens = namespace.get("evens", None)
-        expected = [0, 2, 4, 6, 8, 10]
-        passed = evens == expected
-        results["test_1"] = passed
-        if not passed:
-            all_passed = False
-    except Exception as e:
-        results["test_1"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-    
+def too_complex_result() -> Dict[str, Any]:
+    """Build the failed test result for a submission too deeply nested (or too large) to analyse"""
+    message = "Code is nested too deeply to grade"
     return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly creates the list of even numbers." if all_passed else "Test failed. Make sure you create a list named evens containing all even numbers from 0 to 10 (inclusive): [0, 2, 4, 6, 8, 10]."
+        "passed": False,
+        "tests": {"syntax": False},
+        "output": f"Error: {message}",
+        "message": message
     }
 
-def test_tennessee_q1(code: str) -> Dict[str, Any]:
+class ResourceLimitExceeded(BaseException):
     """
-    Test: Add a key to a dictionary
-    Tests that code adds "grade": 95 to student dictionary
+    Raised inside a running submission when it exceeds its CPU or wall-clock limit
+    Derives from BaseException so the graders' `except Exception` handlers let it
+    propagate up to run_test() instead of counting it as a single failed case
     """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
-    try:
-        # Start with existing student dict
-        namespace = {"student": {"name": "Alex"}}
-        f = io.StringIO()
-        with redirect_stdout(f), redirect_stderr(f):
-            exec(code, namespace)
-        output = f.getvalue().strip()
-        first_output = output if output else "No output (dictionary updated)"
-        
-        # Check if student dict has both keys
-        student = namespace.get("student", {})
-        passed = student.get("name") == "Alex" and student.get("grade") == 95
-        results["test_1"] = passed
-        if not passed:
-            all_passed = False
-    except Exception as e:
-        results["test_1"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-    
+
+class OutputLimitExceeded(ResourceLimitExceeded):
+    """Raised when a submission prints more than its output limit"""
+
+    def __init__(self, message: str, output: str):
+        super().__init__(message)
+        self.output = output
+
+def output_limit_result(error: OutputLimitExceeded) -> Dict[str, Any]:
+    """Build the failed test result for a submission stopped for printing too much"""
+    message = str(error)
     return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly adds the grade key to the dictionary." if all_passed else "Test failed. Make sure you add a key 'grade' with value 95 to the existing student dictionary."
+        "passed": False,
+        "tests": {"output_limit": False},
+        "output": f"{error.output}\nError: {message}",
+        "message": message
     }
 
-def test_new_york_q1(code: str) -> Dict[str, Any]:
-    """
-    Test: Get a value from a dictionary
-    Tests that code gets value from dictionary using key
-    """
-    test_cases = [
-        {"student": {"name": "Alice", "age": 20}, "expected": "Alice"},
-        {"student": {"name": "Bob", "grade": 95}, "expected": "Bob"},
-        {"student": {"name": "Charlie", "city": "NYC"}, "expected": "Charlie"},
-    ]
-    
-    results = {}
-    all_passed = True
-    first_output = ""
-    
-    for i, test_case in enumerate(test_cases):
-        student = test_case["student"]
-        expected = test_case["expected"]
-        
-        try:
-            namespace = {"student": student}
-            f = io.StringIO()
-            with redirect_stdout(f), redirect_stderr(f):
-                exec(code, namespace)
-            output = f.getvalue().strip()
-            
-            if i == 0:
-                first_output = output if output else "No output (value retrieved)"
-            
-            # Check if student_name variable exists and has correct value
-            student_name = namespace.get("student_name", None)
-            passed = student_name == expected
-            results[f"test_{i+1}"] = passed
-            if not passed:
-                all_passed = False
-        except Exception as e:
-            results[f"test_{i+1}"] = False
-            all_passed = False
-            if i == 0:
-                first_output = f"Error: {str(e)}"
-    
+def limit_exceeded_result(message: str) -> Dict[str, Any]:
+    """Build the failed test result for a submission stopped by a resource limit"""
     return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly retrieves the value from the dictionary." if all_passed else "Some tests failed. Make sure you get the value associated with the key 'name' from the student dictionary and store it in a variable named student_name."
+        "passed": False,
+        "tests": {"resource_limits": False},
+        "output": f"Error: {message}",
+        "message": message
     }
 
-def test_kentucky_q1(code: str) -> Dict[str, Any]:
+# Set by grading workers, which are allowed to change process-wide rlimits and signals
+_process_limits_enabled = False
+
+def enable_process_limits() -> None:
     """
-    Test: Create an ArgumentParser
-    Tests that code creates ArgumentParser with description "Demo script"
+    Enforce limits with rlimits and signals for the whole process
+    Only call this from a dedicated grading process: the limits apply to every
+    thread in it while a grader runs.
     """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
-    try:
-        from argparse import ArgumentParser
-        namespace = {"ArgumentParser": ArgumentParser}
-        f = io.StringIO()
-        with redirect_stdout(f), redirect_stderr(f):
-            exec(code, namespace)
-        output = f.getvalue().strip()
-        first_output = output if output else "No output (parser created)"
-        
-        # Check if parser variable exists and has correct description
-        parser = namespace.get("parser", None)
-        if parser is None:
-            results["test_1_parser_exists"] = False
-            all_passed = False
-        else:
-            # Check description
-            passed = hasattr(parser, "description") and parser.description == "Demo script"
-            results["test_1"] = passed
-            if not passed:
-                all_passed = False
-    except Exception as e:
-        results["test_1"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly creates the ArgumentParser." if all_passed else "Test failed. Make sure you create an ArgumentParser named parser with description 'Demo script'."
-    }
+    global _process_limits_enabled
+    _process_limits_enabled = True
 
-def test_indiana_q1(code: str) -> Dict[str, Any]:
+def use_scratch_directory() -> str:
     """
-    Test: Add a filename argument
-    Tests that code adds required string argument "filename" to parser
+    Move a dedicated grading process into a throwaway working directory, so a
+    submission that gets past the in-memory files still can't write next to the server
+    Returns the directory, for the process to remove when it is done
     """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
+    # Imports relative to the old directory ("" on sys.path) must keep working
+    sys.path[:] = [entry or os.getcwd() for entry in sys.path]
+    scratch = tempfile.mkdtemp(prefix="grading-")
+    os.chdir(scratch)
+    return scratch
+
+def _address_space_bytes() -> int:
+    """Current virtual memory size of this process, or 0 if it can't be read"""
     try:
-        from argparse import ArgumentParser
-        parser = ArgumentParser()
-        namespace = {"parser": parser}
-        f = io.StringIO()
-        with redirect_stdout(f), redirect_stderr(f):
-            exec(code, namespace)
-        output = f.getvalue().strip()
-        first_output = output if output else "No output (argument added)"
-        
-        # Check if filename argument was added
-        # Try to parse with filename argument
-        try:
-            args = parser.parse_args(["test.txt"])
-            passed = hasattr(args, "filename") and args.filename == "test.txt"
-            results["test_1"] = passed
-            if not passed:
-                all_passed = False
-        except SystemExit:
-            # SystemExit is normal for argparse, but we need to check differently
-            # Check if the action was added
-            actions = [action for action in parser._actions if action.dest == "filename"]
-            passed = len(actions) > 0 and actions[0].required
-            results["test_1"] = passed
-            if not passed:
-                all_passed = False
-    except Exception as e:
-        results["test_1"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly adds the filename argument." if all_passed else "Test failed. Make sure you add a required string argument called 'filename' to the parser."
-    }
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[0]) * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return 0
 
-def test_illinois_q1(code: str) -> Dict[str, Any]:
-    """
-    Test: Parse command-line arguments
-    Tests that code parses args using parser into args variable
-    """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
+@contextmanager
+def _process_limits(limits: Dict[str, float]):
+    """Apply limits with RLIMIT_CPU, RLIMIT_AS and a real-time interval timer"""
+    def on_cpu_limit(signum, frame):
+        raise ResourceLimitExceeded(f"CPU time limit exceeded ({limits['cpu_seconds']} seconds)")
+
+    def on_wall_limit(signum, frame):
+        raise ResourceLimitExceeded(f"Time limit exceeded ({limits['wall_seconds']} seconds)")
+
+    old_cpu = resource.getrlimit(resource.RLIMIT_CPU)
+    old_as = resource.getrlimit(resource.RLIMIT_AS)
+    old_xcpu = signal.signal(signal.SIGXCPU, on_cpu_limit)
+    old_alrm = signal.signal(signal.SIGALRM, on_wall_limit)
     try:
-        from argparse import ArgumentParser
-        parser = ArgumentParser()
-        parser.add_argument("--name", type=str, default="test")
-        namespace = {"parser": parser}
-        f = io.StringIO()
-        with redirect_stderr(f):  # argparse may write to stderr
-            exec(code, namespace)
-        output = f.getvalue().strip()
-        first_output = output if output else "No output (args parsed)"
-        
-        # Check if args variable exists
-        args = namespace.get("args", None)
-        passed = args is not None and hasattr(args, "name")
-        results["test_1"] = passed
-        if not passed:
-            all_passed = False
-    except Exception as e:
-        results["test_1"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly parses the arguments." if all_passed else "Test failed. Make sure you call parser.parse_args() and store the result in a variable named args."
-    }
+        # RLIMIT_CPU counts the whole life of the process, so offset it by what's used
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        cpu_soft = math.ceil(usage.ru_utime + usage.ru_stime + limits["cpu_seconds"])
+        if old_cpu[1] != resource.RLIM_INFINITY:
+            cpu_soft = min(cpu_soft, old_cpu[1])
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_soft, old_cpu[1]))
+
+        current_as = _address_space_bytes()
+        if current_as:
+            as_soft = current_as + int(limits["memory_mb"] * 1024 * 1024)
+            if old_as[1] != resource.RLIM_INFINITY:
+                as_soft = min(as_soft, old_as[1])
+            resource.setrlimit(resource.RLIMIT_AS, (as_soft, old_as[1]))
+
+        signal.setitimer(signal.ITIMER_REAL, limits["wall_seconds"])
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        resource.setrlimit(resource.RLIMIT_AS, old_as)
+        resource.setrlimit(resource.RLIMIT_CPU, old_cpu)
+        signal.signal(signal.SIGALRM, old_alrm)
+        signal.signal(signal.SIGXCPU, old_xcpu)
+
+def _raise_in_thread(ident: int, exception: Optional[type]) -> None:
+    """Make `exception` raise in thread ident at its next bytecode boundary (None cancels it)"""
+    # A NULL exception (None) clears the pending one
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(ident),
+                                               ctypes.py_object(exception) if exception is not None else None)
 
-def test_atlantic_q1(code: str) -> Dict[str, Any]:
+class _LimitWatchdog:
     """
-    Test: Open a file with with-statement
-    Tests that code opens data.txt for reading using with statement
+    A daemon thread that checks the threads grading under _thread_limits()
+    every `interval` seconds and raises ResourceLimitExceeded in any that has
+    run out of wall-clock or CPU time. Unlike a trace function it adds nothing
+    to the submission's own run time.
     """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
-    import tempfile
-    import os
-    import ast
-    import re
-    
-    temp_file = None
-    
-    try:
-        # Test 1: Check that code contains "data.txt" exactly (not misspelled)
-        # Look for "data.txt" in quotes (single or double)
-        has_data_txt = bool(re.search(r'["\']data\.txt["\']', code))
-        results["test_1_filename"] = has_data_txt
-        if not has_data_txt:
-            all_passed = False
-            first_output = "Error: Code must open 'data.txt' (check spelling)"
-        
-        # Test 2: Check that code uses a 'with' statement
-        has_with = "with" in code
-        results["test_2_with_statement"] = has_with
-        if not has_with:
-            all_passed = False
-            if not first_output:
-                first_output = "Error: Code must use a 'with' statement"
-        
-        # Test 3: Parse AST to verify structure and variable name
+
+    interval = 0.01
+
+    def __init__(self):
+        self._watched: Dict[int, Dict[str, Any]] = {}
+        self._changed = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, limits: Dict[str, float]) -> None:
+        """Start timing the calling thread; pair with unwatch()"""
+        ident = threading.get_ident()
         try:
-            tree = ast.parse(code)
-            found_correct_with = False
-            
-            # Look for a 'with' statement that opens "data.txt" and assigns to 'f'
-            for node in ast.walk(tree):
-                if isinstance(node, ast.With):
-                    # Check each item in the with statement
-                    for item in node.items:
-                        # Must be an open() call
-                        is_open_call = False
-                        opens_data_txt = False
-                        variable_is_f = False
-                        
-                        if isinstance(item.context_expr, ast.Call):
-                            func = item.context_expr.func
-                            if isinstance(func, ast.Name) and func.id == 'open':
-                                is_open_call = True
-                                
-                                # Check the filename argument - must be literal "data.txt"
-                                if item.context_expr.args:
-                                    filename_arg = item.context_expr.args[0]
-                                    filename = None
-                                    
-                                    if isinstance(filename_arg, ast.Constant):
-                                        filename = filename_arg.value
-                                    elif isinstance(filename_arg, ast.Str):  # Python < 3.8
-                                        filename = filename_arg.s
-                                    
-                                    if filename == "data.txt":
-                                        opens_data_txt = True
-                        
-                        # Check if the variable is named 'f' (must be direct assignment in 'as' clause)
-                        if item.optional_vars:
-                            if isinstance(item.optional_vars, ast.Name):
-                                if item.optional_vars.id == 'f':
-                                    variable_is_f = True
-                        
-                        # All three conditions must be true for this with statement
-                        if is_open_call and opens_data_txt and variable_is_f:
-                            found_correct_with = True
-                            break
-                    
-                    if found_correct_with:
-                        break
-            
-            results["test_3_ast_structure"] = found_correct_with
-            if not found_correct_with:
-                all_passed = False
-                if not first_output:
-                    # More specific error messages
-                    has_any_with = any(isinstance(node, ast.With) for node in ast.walk(tree))
-                    if not has_any_with:
-                        first_output = "Error: Code must use a 'with' statement"
+            cpu_clock = time.pthread_getcpuclockid(ident)
+        except (AttributeError, OSError):  # no per-thread CPU clocks; the wall limit still applies
+            cpu_clock = None
+        with self._changed:
+            self._watched[ident] = {
+                "limits": limits,
+                "wall_deadline": time.monotonic() + limits["wall_seconds"],
+                "cpu_clock": cpu_clock,
+                "cpu_deadline": time.thread_time() + limits["cpu_seconds"],
+                "message": None
+            }
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="grading-watchdog", daemon=True)
+                self._thread.start()
+            self._changed.notify()
+
+    def unwatch(self) -> Optional[str]:
+        """Stop timing the calling thread; returns why it was stopped, if it was"""
+        ident = threading.get_ident()
+        with self._changed:
+            entry = self._watched.pop(ident, None)
+            if entry is None or entry["message"] is None:
+                return None
+            # Cancel the exception in case the thread finished before it was raised
+            _raise_in_thread(ident, None)
+            return entry["message"]
+
+    def _run(self) -> None:
+        with self._changed:
+            while True:
+                self._changed.wait(self.interval if self._watched else None)
+                now = time.monotonic()
+                for ident, entry in self._watched.items():
+                    if entry["message"] is not None:
+                        continue
+                    limits = entry["limits"]
+                    if now > entry["wall_deadline"]:
+                        entry["message"] = f"Time limit exceeded ({limits['wall_seconds']} seconds)"
+                    elif entry["cpu_clock"] is not None and time.clock_gettime(entry["cpu_clock"]) > entry["cpu_deadline"]:
+                        entry["message"] = f"CPU time limit exceeded ({limits['cpu_seconds']} seconds)"
                     else:
-                        # Check if we have a with statement but wrong details
-                        has_open_call = False
-                        has_f_var = False
-                        has_data_txt = False
-                        
-                        for node in ast.walk(tree):
-                            if isinstance(node, ast.With):
-                                for item in node.items:
-                                    if isinstance(item.context_expr, ast.Call):
-                                        func = item.context_expr.func
-                                        if isinstance(func, ast.Name) and func.id == 'open':
-                                            has_open_call = True
-                                            # Check filename
-                                            if item.context_expr.args:
-                                                filename_arg = item.context_expr.args[0]
-                                                if isinstance(filename_arg, (ast.Constant, ast.Str)):
-                                                    filename = filename_arg.value if isinstance(filename_arg, ast.Constant) else filename_arg.s
-                                                    if filename == "data.txt":
-                                                        has_data_txt = True
-                                    if item.optional_vars and isinstance(item.optional_vars, ast.Name):
-                                        if item.optional_vars.id == 'f':
-                                            has_f_var = True
-                        
-                        if not has_open_call:
-                            first_output = "Error: Must use open() function"
-                        elif not has_data_txt:
-                            first_output = "Error: Must open 'data.txt' (check spelling)"
-                        elif not has_f_var:
-                            first_output = "Error: File must be assigned to variable named 'f'"
-                        else:
-                            first_output = "Error: Must use 'with open(\"data.txt\") as f:'"
-        except SyntaxError as e:
-            results["test_3_ast_structure"] = False
-            all_passed = False
-            if not first_output:
-                first_output = f"Syntax error: {str(e)}"
-        
-        # Test 4: Actually execute the code with a temp file to verify it works
-        if all_passed:  # Only run execution test if other tests pass
-            try:
-                # Create a temporary file
-                with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as tmp:
-                    tmp.write("test content")
-                    temp_file = tmp.name
-                
-                # Replace "data.txt" with temp file in code (exact match only)
-                code_with_temp = code.replace('"data.txt"', f'"{temp_file}"').replace("'data.txt'", f"'{temp_file}'")
-                
-                # Verify the replacement happened (if it didn't, the filename was wrong)
-                if temp_file not in code_with_temp and '"data.txt"' not in code and "'data.txt'" not in code:
-                    results["test_4_execution"] = False
-                    all_passed = False
-                    if not first_output:
-                        first_output = "Error: Could not find 'data.txt' in code"
-                else:
-                    namespace = {}
-                    f = io.StringIO()
-                    with redirect_stdout(f), redirect_stderr(f):
-                        exec(code_with_temp, namespace)
-                    output = f.getvalue().strip()
-                    first_output = output if output else "File opened successfully"
-                    
-                    # Check if variable 'f' exists in namespace (it should be closed after with block)
-                    # Actually, 'f' might not exist after the with block closes, so we just check if it ran without error
-                    results["test_4_execution"] = True
-            except Exception as e:
-                results["test_4_execution"] = False
-                all_passed = False
-                first_output = f"Error executing code: {str(e)}"
-        else:
-            results["test_4_execution"] = False
-        
-        # Clean up
-        if temp_file and os.path.exists(temp_file):
-            os.unlink(temp_file)
-    except Exception as e:
-        results["test_1_filename"] = False
-        results["test_2_with_statement"] = False
-        results["test_3_ast_structure"] = False
-        results["test_4_execution"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-        if temp_file and os.path.exists(temp_file):
-            os.unlink(temp_file)
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly opens the file using a with statement." if all_passed else "Test failed. Make sure you open 'data.txt' for reading using a with statement and assign it to a variable named f."
-    }
+                        continue
+                    _raise_in_thread(ident, ResourceLimitExceeded)
 
-def test_ventnor_q1(code: str) -> Dict[str, Any]:
-    """
-    Test: Read a whole file into a string
-    Tests that code reads entire contents of data.txt into text variable
-    """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
-    import tempfile
-    import os
-    
-    test_cases = [
-        {"content": "Hello, world!"},
-        {"content": "Line 1\nLine 2\nLine 3"},
-        {"content": "Single line"},
-    ]
-    
-    for i, test_case in enumerate(test_cases):
-        content = test_case["content"]
-        
-        try:
-            # Create a temporary file
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as tmp:
-                tmp.write(content)
-                temp_file = tmp.name
-            
-            # Replace "data.txt" with temp file in code
-            code_with_temp = code.replace('"data.txt"', f'"{temp_file}"').replace("'data.txt'", f"'{temp_file}'")
-            
-            namespace = {}
-            f = io.StringIO()
-            with redirect_stdout(f), redirect_stderr(f):
-                exec(code_with_temp, namespace)
-            output = f.getvalue().strip()
-            
-            if i == 0:
-                first_output = output if output else "No output (file read)"
-            
-            # Check if text variable exists and has correct content
-            text = namespace.get("text", None)
-            passed = text == content
-            results[f"test_{i+1}"] = passed
-            if not passed:
-                all_passed = False
-            
-            # Clean up
-            if os.path.exists(temp_file):
-                os.unlink(temp_file)
-        except Exception as e:
-            results[f"test_{i+1}"] = False
-            all_passed = False
-            if i == 0:
-                first_output = f"Error: {str(e)}"
-            if os.path.exists(temp_file):
-                os.unlink(temp_file)
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly reads the file contents." if all_passed else "Some tests failed. Make sure you read the entire contents of 'data.txt' into a variable named text."
-    }
+_watchdog = _LimitWatchdog()
 
-def test_marvin_gardens_q1(code: str) -> Dict[str, Any]:
+@contextmanager
+def _thread_limits(limits: Dict[str, float]):
     """
-    Test: Append a line to a log file
-    Tests that code appends "done\n" to log.txt
+    Apply the wall-clock and CPU limits to the current thread with the watchdog
+    The limit is raised at the next bytecode boundary, so even `while True: pass`
+    is stopped; time spent inside a single C call can't be interrupted. Memory is
+    not limited, since there is no per-thread equivalent of RLIMIT_AS.
     """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
-    import tempfile
-    import os
-    
+    _watchdog.watch(limits)
     try:
-        # Create a temporary file
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as tmp:
-            tmp.write("existing content\n")
-            temp_file = tmp.name
-        
-        # Replace "log.txt" with temp file in code
-        code_with_temp = code.replace('"log.txt"', f'"{temp_file}"').replace("'log.txt'", f"'{temp_file}'")
-        
-        namespace = {}
-        f = io.StringIO()
-        with redirect_stdout(f), redirect_stderr(f):
-            exec(code_with_temp, namespace)
-        output = f.getvalue().strip()
-        first_output = output if output else "No output (file appended)"
-        
-        # Check if file was appended correctly
-        with open(temp_file, 'r') as f_check:
-            file_content = f_check.read()
-        passed = "done\n" in file_content or file_content.endswith("done\n")
-        results["test_1"] = passed
-        if not passed:
-            all_passed = False
-        
-        # Clean up
-        if os.path.exists(temp_file):
-            os.unlink(temp_file)
-    except Exception as e:
-        results["test_1"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-        if os.path.exists(temp_file):
-            os.unlink(temp_file)
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly appends to the file." if all_passed else "Test failed. Make sure you append the string 'done\\n' to the file 'log.txt'."
-    }
+        yield
+    except ResourceLimitExceeded as e:
+        # The watchdog can only raise the bare class, so attach its message here
+        message = _watchdog.unwatch()
+        if message is None or str(e):
+            raise
+        raise ResourceLimitExceeded(message) from None
+    finally:
+        _watchdog.unwatch()
 
-def test_pacific_q1(code: str) -> Dict[str, Any]:
+@contextmanager
+def enforce_limits(limits: Dict[str, float]):
     """
-    Test: Send a GET request
-    Tests that code sends GET request to URL and stores response
+    Context manager enforcing limits on the grader running inside it
+    Uses real rlimits in grading worker processes, and a per-thread tracer anywhere
+    else so the web server's own limits are never touched. Output is capped at
+    limits["output_bytes"] in either case.
     """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
+    if (_process_limits_enabled and resource is not None
+            and threading.current_thread() is threading.main_thread()):
+        runtime_limits = _process_limits(limits)
+    else:
+        runtime_limits = _thread_limits(limits)
+    token = _output_limit.set(limits.get("output_bytes"))
     try:
-        from unittest.mock import Mock, MagicMock
-        import sys
-        
-        # Create a mock response object
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = "test response"
-        mock_response.json.return_value = {"key": "value"}
-        
-        # Pre-populate namespace with mock requests to handle import
-        # This allows "import requests" to work without the actual library
-        original_modules = sys.modules.copy()
-        try:
-            # Create a fake requests module with get method
-            fake_requests = MagicMock()
-            fake_requests.get.return_value = mock_response
-            sys.modules['requests'] = fake_requests
-            
-            # Also add requests to namespace in case code doesn't import it
-            namespace = {
-                "__builtins__": __builtins__,
-                "requests": fake_requests
-            }
-            
-            f = io.StringIO()
-            with redirect_stdout(f), redirect_stderr(f):
-                exec(code, namespace)
-            output = f.getvalue().strip()
-        finally:
-            # Restore original modules
-            sys.modules.clear()
-            sys.modules.update(original_modules)
-        
-        first_output = output if output else "No output (request sent)"
-        
-        # Check if response variable exists and is the mock_response (meaning get() was called)
-        response = namespace.get("response", None)
-        if response is None:
-            results["test_1_response_exists"] = False
-            all_passed = False
-        else:
-            # Check if it has Response-like attributes (status_code and text)
-            has_attributes = hasattr(response, "status_code") and hasattr(response, "text")
-            
-            # Verify that response is our mock_response (meaning requests.get() was called, not post())
-            # If requests.post() or other methods were called, they would return a different mock
-            is_correct_response = response is mock_response
-            
-            # Verify that requests.get() was actually called with the URL
-            get_was_called = fake_requests.get.called if hasattr(fake_requests.get, "called") else False
-            get_call_args = fake_requests.get.call_args if hasattr(fake_requests.get, "call_args") else None
-            
-            # Check if the URL was passed as an argument
-            url_provided = False
-            expected_url = "https://api.example.com/data"
-            if get_call_args is not None:
-                # call_args is a tuple of (args, kwargs)
-                args = get_call_args[0] if len(get_call_args) > 0 else ()
-                kwargs = get_call_args[1] if len(get_call_args) > 1 else {}
-                
-                # Check if URL is in the positional arguments (first arg)
-                if len(args) > 0:
-                    url_provided = args[0] == expected_url
-                # Or check keyword arguments
-                elif "url" in kwargs:
-                    url_provided = kwargs.get("url") == expected_url
-            
-            # Must have response, correct attributes, be the right response object, 
-            # get() must be called, and URL must be provided
-            passed = (has_attributes and is_correct_response and get_was_called and url_provided)
-            results["test_1"] = passed
-            if not passed:
-                all_passed = False
-    except Exception as e:
-        results["test_1"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly sends the GET request." if all_passed else "Test failed. Make sure you send a GET request to the URL and store the response in a variable named response."
-    }
+        with runtime_limits:
+            yield
+    finally:
+        _output_limit.reset(token)
+
+# Question test specs live next to the question text that the frontend loads
+DATA_DIR = Path(__file__).parent / "src" / "data"
+TEST_SPECS_FILE = DATA_DIR / "question_tests.json"
+QUESTIONS_FILE = DATA_DIR / "questions.json"
+ANSWER_KEY_FILE = Path(__file__).parent / "CODE_ANSWER_KEY.md"
 
-def test_north_carolina_q1(code: str) -> Dict[str, Any]:
+# A check's expected "output"/"equals" value that is taken from the question's
+# reference solution instead of being written into the spec
+REFERENCE = "$reference"
+
+def load_test_specs() -> Dict[str, Dict[str, Any]]:
     """
-    Test: Parse JSON from a response
-    Tests that code extracts JSON data from response into data variable
+    Load the declarative test spec for every question
+    Multiple-choice specs take their answer from questions.json. "$reference"
+    expectations are left for TEST_REGISTRY to fill in on first use.
     """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
-    try:
-        from unittest.mock import Mock, MagicMock
-        import sys
-        
-        # Create a mock response object
-        mock_response = Mock()
-        mock_response.json.return_value = {"key": "value", "number": 42}
-        
-        namespace = {
-            "response": mock_response,
-            "__builtins__": __builtins__
-        }
-        
-        # Pre-populate namespace with mock requests to handle import
-        # This allows "import requests" to work without the actual library
-        original_modules = sys.modules.copy()
-        try:
-            # Create a fake requests module
-            fake_requests = MagicMock()
-            sys.modules['requests'] = fake_requests
-            
-            f = io.StringIO()
-            with redirect_stdout(f), redirect_stderr(f):
-                exec(code, namespace)
-            output = f.getvalue().strip()
-        finally:
-            # Restore original modules
-            sys.modules.clear()
-            sys.modules.update(original_modules)
-        
-        first_output = output if output else "No output (JSON parsed)"
-        
-        # Check if data variable exists and has correct value
-        data = namespace.get("data", None)
-        expected = {"key": "value", "number": 42}
-        passed = data == expected
-        results["test_1"] = passed
-        if not passed:
-            all_passed = False
-    except Exception as e:
-        results["test_1"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly extracts JSON from the response." if all_passed else "Test failed. Make sure you extract JSON data from the response object and store it in a variable named data."
-    }
+    with open(TEST_SPECS_FILE) as f:
+        specs = json.load(f)
+    with open(QUESTIONS_FILE) as f:
+        questions = {question["question_id"]: question for question in json.load(f)}
 
-def test_pennsylvania_q1(code: str) -> Dict[str, Any]:
+    for question_id, spec in specs.items():
+        if spec.get("type") == "multiple_choice":
+            spec.setdefault("answer", questions[question_id]["correct_answer"])
+    return specs
+
+@functools.lru_cache(maxsize=None)
+def load_reference_solutions() -> Dict[str, List[str]]:
     """
-    Test: Check response status code
-    Tests that code stores status code from response object
+    Reference solutions from CODE_ANSWER_KEY.md: question_id -> code blocks,
+    with the main "Expected Code" first and then the alternatives
     """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
-    try:
-        from unittest.mock import Mock, MagicMock
-        
-        # Create mock response objects with different status codes
-        test_cases = [
-            {"status_code": 200},
-            {"status_code": 404},
-            {"status_code": 500},
-        ]
-        
-        for i, test_case in enumerate(test_cases):
-            status_code = test_case["status_code"]
-            mock_response = Mock()
-            mock_response.status_code = status_code
-            
-            namespace = {
-                "response": mock_response,
-                "__builtins__": __builtins__
-            }
-            
-            # Pre-populate namespace with mock requests to handle import
-            import sys
-            original_modules = sys.modules.copy()
-            try:
-                # Create a fake requests module
-                fake_requests = MagicMock()
-                sys.modules['requests'] = fake_requests
-                
-                f = io.StringIO()
-                with redirect_stdout(f), redirect_stderr(f):
-                    exec(code, namespace)
-                output = f.getvalue().strip()
-            finally:
-                # Restore original modules
-                sys.modules.clear()
-                sys.modules.update(original_modules)
-            
-            if i == 0:
-                first_output = output if output else "No output (status code stored)"
-            
-            # Check if status_code variable exists and has correct value
-            status_code_var = namespace.get("status_code", None)
-            passed = status_code_var == status_code
-            results[f"test_{i+1}_status_{status_code}"] = passed
-            if not passed:
-                all_passed = False
-    except Exception as e:
-        results["test_1"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly stores the status code." if all_passed else "Test failed. Make sure you store the status code from the response object in a variable named status_code."
-    }
+    if not ANSWER_KEY_FILE.exists():
+        return {}
+    solutions = {}
+    for section in re.split(r"^### ", ANSWER_KEY_FILE.read_text(), flags=re.M)[1:]:
+        question_id = section.split(None, 1)[0]
+        solutions[question_id] = re.findall(r"```python\n(.*?)```", section, flags=re.S)
+    return solutions
+
+# Fixtures: Python objects a spec can place in the namespace ("fixtures") or hand
+# to the submission's imports ("modules"), built fresh for every test case
+
+@functools.lru_cache(maxsize=None)
+def _argv_free_parser_class():
+    """ArgumentParser that parses an empty command line by default, so results
+    never depend on the server's own sys.argv"""
+    from argparse import ArgumentParser
+
+    class GradingArgumentParser(ArgumentParser):
+        def parse_known_args(self, args=None, namespace=None):
+            return super().parse_known_args([] if args is None else args, namespace)
+
+    GradingArgumentParser.__name__ = "ArgumentParser"
+    return GradingArgumentParser
+
+def _fixture_argument_parser_class(params: Dict[str, Any]) -> Any:
+    return _argv_free_parser_class()
+
+def _fixture_argument_parser(params: Dict[str, Any]) -> Any:
+    parser = _argv_free_parser_class()()
+    for argument in params.get("arguments", []):
+        options = {key: value for key, value in argument.items() if key != "flags"}
+        parser.add_argument(*argument["flags"], **options)
+    return parser
+
+def _fixture_format_function(params: Dict[str, Any]) -> Any:
+    template = params["template"]
+    return lambda *args: template.format(*args)
+
+class _HTTPError(Exception):
+    """Stands in for requests.HTTPError (and requests.RequestException)"""
+
+class _FakeResponse:
+    """Minimal requests.Response: only what the HTTP questions read"""
 
-def test_park_place_q1(code: str) -> Dict[str, Any]:
+    __slots__ = ("status_code", "text", "url", "headers", "_json")
+
+    def __init__(self, status_code: int = 200, text: str = "", json: Any = None, url: str = ""):
+        self.status_code = status_code
+        self.text = text
+        self.url = url
+        self.headers: Dict[str, str] = {}
+        self._json = json
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    @property
+    def content(self) -> bytes:
+        return self.text.encode()
+
+    def json(self, **kwargs) -> Any:
+        return self._json
+
+    def raise_for_status(self) -> None:
+        if not self.ok:
+            raise _HTTPError(f"{self.status_code} Error for url: {self.url}")
+
+class _FakeRequests:
     """
-    Test: Get response text content
-    Tests that code stores text content from response object
+    Stand-in for the requests module that never touches the network
+    Every call is appended to `calls` as (method, args, kwargs) and returns the
+    response configured for that method, the same object each time.
     """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
+
+    __slots__ = ("calls", "responses")
+
+    HTTPError = RequestException = _HTTPError
+
+    def __init__(self, responses: Dict[str, _FakeResponse]):
+        self.calls: List[Tuple[str, tuple, Dict[str, Any]]] = []
+        self.responses = responses
+
+    def _send(self, method: str, args: tuple, kwargs: Dict[str, Any]) -> _FakeResponse:
+        self.calls.append((method, args, kwargs))
+        response = self.responses.setdefault(method, _FakeResponse())
+        response.url = args[0] if args else kwargs.get("url", "")
+        return response
+
+    def get(self, *args, **kwargs) -> _FakeResponse:
+        return self._send("get", args, kwargs)
+
+    def post(self, *args, **kwargs) -> _FakeResponse:
+        return self._send("post", args, kwargs)
+
+    def put(self, *args, **kwargs) -> _FakeResponse:
+        return self._send("put", args, kwargs)
+
+    def patch(self, *args, **kwargs) -> _FakeResponse:
+        return self._send("patch", args, kwargs)
+
+    def delete(self, *args, **kwargs) -> _FakeResponse:
+        return self._send("delete", args, kwargs)
+
+    @property
+    def exceptions(self) -> "_FakeRequests":
+        # requests.exceptions.HTTPError / RequestException
+        return self
+
+def _fixture_response(params: Dict[str, Any]) -> Any:
+    return _FakeResponse(
+        status_code=params.get("status_code", 200),
+        text=params.get("text", ""),
+        json=copy.deepcopy(params.get("json"))
+    )
+
+def _fixture_requests(params: Dict[str, Any]) -> Any:
+    return _FakeRequests({method: _fixture_response(params[method]) for method in HTTP_METHODS if method in params})
+
+HTTP_METHODS = ("get", "post", "put", "patch", "delete")
+
+FIXTURES: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    "argument_parser_class": _fixture_argument_parser_class,
+    "argument_parser": _fixture_argument_parser,
+    "format_function": _fixture_format_function,
+    "response": _fixture_response,
+    "requests": _fixture_requests,
+}
+
+class _CaseRun:
+    """Everything one execution of a test case produced, for checks to inspect"""
+
+    def __init__(self, spec: Dict[str, Any], case: Dict[str, Any]):
+        def merged(key: str) -> Dict[str, Any]:
+            return {**spec.get(key, {}), **case.get(key, {})}
+
+        self.namespace: Dict[str, Any] = copy.deepcopy(merged("vars"))
+        for name, params in merged("fixtures").items():
+            self.namespace[name] = FIXTURES[params["fixture"]](params)
+        self.modules = {name: FIXTURES[params["fixture"]](params) for name, params in merged("modules").items()}
+        # Stub modules are also usable without an import statement
+        self.namespace.update(self.modules)
+        files = merged("files")
+        self.files = VirtualFS(files) if files else None
+        self.output = ""
+
+    def run(self, compiled: CodeType) -> None:
+        self.output = run_code(compiled, self.namespace, modules=self.modules, files=self.files).strip()
+
+# Returned by _resolve() for a name or attribute the submission never set
+_MISSING = object()
+
+def _resolve(namespace: Dict[str, Any], path: str) -> Any:
+    """Look up a dotted path such as "parser.description" in the namespace"""
+    name, *attributes = path.split(".")
+    value = namespace.get(name, _MISSING)
+    for attribute in attributes:
+        if value is _MISSING:
+            break
+        value = getattr(value, attribute, _MISSING)
+    return value
+
+def _compare(value: Any, check: Dict[str, Any]) -> bool:
+    """Apply a check's comparison ("equals" or "includes") to a value"""
+    if value is _MISSING:
+        return False
+    if "equals" in check:
+        return value == check["equals"]
+    if "includes" in check:
+        expected = check["includes"]
+        if isinstance(expected, dict):
+            return isinstance(value, dict) and all(key in value and value[key] == item for key, item in expected.items())
+        return expected in value
+    return value is not None
+
+def _check_request(check: Dict[str, Any], run: _CaseRun) -> bool:
+    """Verify the submission called requests.<method>(url, ...) and kept its response"""
+    fake_requests = run.modules[check.get("module", "requests")]
+    calls = [call for call in fake_requests.calls if call[0] == check["request"]]
+    response = run.namespace.get(check["returned"], _MISSING)
+    if not calls or response is not fake_requests.responses[check["request"]]:
+        return False
+
+    _, args, kwargs = calls[-1]
+    url = args[0] if args else kwargs.get("url")
+    if url != check["url"]:
+        return False
+    return "json" not in check or kwargs.get("json") == check["json"]
+
+def _check_parse_args(check: Dict[str, Any], run: _CaseRun) -> bool:
+    """Parse a command line with the namespace's parser and compare one argument"""
+    parser = _resolve(run.namespace, check["parser"])
     try:
-        from unittest.mock import Mock, MagicMock
-        
-        # Create mock response objects with different text content
-        test_cases = [
-            {"text": "Hello, world!"},
-            {"text": "{\"key\": \"value\"}"},
-            {"text": "Line 1\nLine 2\nLine 3"},
-        ]
-        
-        for i, test_case in enumerate(test_cases):
-            text_content = test_case["text"]
-            mock_response = Mock()
-            mock_response.text = text_content
-            
-            # Create a mock requests module to handle import requests
-            mock_requests = MagicMock()
-            
-            namespace = {
-                "response": mock_response,
-                "__builtins__": __builtins__
-            }
-            
-            # Pre-populate namespace with mock requests to handle import
-            # This allows "import requests" to work without the actual library
-            import sys
-            original_modules = sys.modules.copy()
-            try:
-                # Create a fake requests module
-                fake_requests = MagicMock()
-                sys.modules['requests'] = fake_requests
-                
-                f = io.StringIO()
-                with redirect_stdout(f), redirect_stderr(f):
-                    exec(code, namespace)
-                output = f.getvalue().strip()
-            finally:
-                # Restore original modules
-                sys.modules.clear()
-                sys.modules.update(original_modules)
-            
-            if i == 0:
-                first_output = output if output else "No output (content stored)"
-            
-            # Check if content variable exists and has correct value
-            content = namespace.get("content", None)
-            passed = content == text_content
-            results[f"test_{i+1}"] = passed
-            if not passed:
-                all_passed = False
-    except Exception as e:
-        results["test_1"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly stores the response text content." if all_passed else "Test failed. Make sure you store the text content from the response object in a variable named content."
-    }
+        args = parser.parse_args(check["parse_args"])
+    except SystemExit:
+        # Other required arguments made parsing fail; the argument still counts
+        # if it was added as a required one
+        actions = [action for action in parser._actions if action.dest == check["dest"]]
+        return len(actions) > 0 and actions[0].required
+    return _compare(getattr(args, check["dest"], _MISSING), check)
+
+def _observe(check: Dict[str, Any], run: _CaseRun) -> Any:
+    """The value an "output", "variable", "call" or "file" check compares against its expectation"""
+    if "output" in check:
+        return run.output
+    if "variable" in check:
+        paths = check["variable"] if isinstance(check["variable"], list) else [check["variable"]]
+        value = _MISSING
+        for path in paths:
+            value = _resolve(run.namespace, path)
+            if value not in (None, _MISSING):
+                break
+        return value
+    if "call" in check:
+        function = _resolve(run.namespace, check["call"])
+        return function(*check.get("args", []), **check.get("kwargs", {}))
+    if "file" in check:
+        if run.files is None or check["file"] not in run.files.files:
+            return _MISSING
+        return run.files.read_text(check["file"])
+    raise ValueError(f"Check has no observable value: {check}")
 
-def test_boardwalk_q1(code: str) -> Dict[str, Any]:
+def _evaluate(check: Dict[str, Any], run: _CaseRun) -> bool:
+    """Evaluate one declarative check against a finished test case run"""
+    if "any" in check:
+        return any(_evaluate(option, run) for option in check["any"])
+    if "output" in check:
+        return _observe(check, run) == check["output"]
+    if "output_format" in check:
+        # Expected output built from the namespace the submission left behind
+        return run.output == check["output_format"].format_map(run.namespace)
+    if "output_includes" in check:
+        if check.get("ignore_case"):
+            return check["output_includes"].lower() in run.output.lower()
+        return check["output_includes"] in run.output
+    if "defined" in check:
+        return _resolve(run.namespace, check["defined"]) not in (None, _MISSING)
+    if "variable" in check or "call" in check or "file" in check:
+        return _compare(_observe(check, run), check)
+    if "request" in check:
+        return _check_request(check, run)
+    if "parse_args" in check:
+        return _check_parse_args(check, run)
+    raise ValueError(f"Unknown check: {check}")
+
+# What a submission's code may raise that fails the case instead of the grader:
+# any error, plus exit(), sys.exit() or an argparse error (SystemExit) and
+# KeyboardInterrupt; ResourceLimitExceeded still stops the whole run
+SUBMISSION_ERRORS = (Exception, SystemExit, KeyboardInterrupt)
+
+def _describe_error(error: BaseException) -> str:
+    if isinstance(error, SystemExit):
+        return f"Code exited (exit status {error.code})"
+    return str(error) or type(error).__name__
+
+def _safe_evaluate(check: Dict[str, Any], run: _CaseRun) -> bool:
+    """Evaluate a check, counting any error raised by the submission's objects as a failure"""
+    try:
+        return bool(_evaluate(check, run))
+    except SUBMISSION_ERRORS:
+        return False
+
+def _dotted_name(node: ast.AST) -> Optional[str]:
+    """"requests.get" for requests.get, "open" for open; None for anything else"""
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        base = _dotted_name(node.value)
+        return f"{base}.{node.attr}" if base else None
+    return None
+
+class SubmissionFacts(ast.NodeVisitor):
     """
-    Test: Send a POST request with data
-    Tests that code sends POST request with JSON data and stores response
+    Everything the graders ask about a submission's structure, collected in a
+    single traversal of its AST so no check has to walk the tree again
     """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
-    try:
-        from unittest.mock import Mock, MagicMock
-        import sys
-        
-        # Create a mock response
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = "Success"
-        mock_response.json.return_value = {"status": "success"}
-        
-        # Expected values
-        expected_url = "https://api.example.com/submit"
-        expected_json = {"name": "Alice", "age": 30}
-        
-        # Pre-populate namespace with mock requests to handle import
-        # This allows "import requests" to work without the actual library
-        original_modules = sys.modules.copy()
-        try:
-            # Create a fake requests module with post method
-            fake_requests = MagicMock()
-            fake_requests.post.return_value = mock_response
-            sys.modules['requests'] = fake_requests
-            
-            # Also add requests to namespace in case code doesn't import it
-            namespace = {
-                "__builtins__": __builtins__,
-                "requests": fake_requests
-            }
-            
-            f = io.StringIO()
-            with redirect_stdout(f), redirect_stderr(f):
-                exec(code, namespace)
-            output = f.getvalue().strip()
-        finally:
-            # Restore original modules
-            sys.modules.clear()
-            sys.modules.update(original_modules)
-        
-        first_output = output if output else "No output (POST request sent)"
-        
-        # Check if response variable exists and is the mock_response
-        response = namespace.get("response", None)
-        if response is None:
-            results["test_1_response_exists"] = False
-            all_passed = False
-        else:
-            # Check if it has Response-like attributes
-            has_attributes = hasattr(response, "status_code")
-            
-            # Verify that response is our mock_response (meaning requests.post() was called, not get())
-            is_correct_response = response is mock_response
-            
-            # Verify that requests.post() was actually called
-            post_was_called = fake_requests.post.called if hasattr(fake_requests.post, "called") else False
-            post_call_args = fake_requests.post.call_args if hasattr(fake_requests.post, "call_args") else None
-            
-            # Check if the URL and JSON data were passed correctly
-            url_correct = False
-            json_correct = False
-            
-            if post_call_args is not None:
-                # call_args is a tuple of (args, kwargs)
-                args = post_call_args[0] if len(post_call_args) > 0 else ()
-                kwargs = post_call_args[1] if len(post_call_args) > 1 else {}
-                
-                # Check URL in positional arguments (first arg)
-                if len(args) > 0:
-                    url_correct = args[0] == expected_url
-                
-                # Check JSON data in kwargs
-                # When json=data is passed, Python evaluates the variable and passes the actual dict value
-                if "json" in kwargs:
-                    json_data = kwargs.get("json")
-                    # json_data should be the actual dict value (not a variable name)
-                    if isinstance(json_data, dict):
-                        json_correct = json_data == expected_json
-                    else:
-                        json_correct = False
-            
-            # Must have response, correct attributes, be the right response object, 
-            # post() must be called, URL must be correct, and JSON must be correct
-            passed = (has_attributes and is_correct_response and post_was_called and url_correct and json_correct)
-            results["test_1"] = passed
-            if not passed:
-                all_passed = False
-    except Exception as e:
-        results["test_1"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "All tests passed! Your code correctly sends the POST request with JSON data." if all_passed else "Test failed. Make sure you send a POST request to the URL with the JSON data {\"name\": \"Alice\", \"age\": 30} and store the response in a variable named response."
-    }
 
-def test_reading_railroad_q1(code: str) -> Dict[str, Any]:
+    def __init__(self, tree: ast.AST):
+        self.assigned: set = set()                         # names bound anywhere
+        self.with_items: List[Dict[str, Any]] = []         # {"call", "args", "as"}
+        self.imports: List[str] = []                       # top-level modules, in order
+        self.literals: set = set()                         # constant values
+        self.statements: set = set()                       # lowercased statement kinds, e.g. "with"
+        self.unbounded_loops = 0                           # `while True` loops that never exit
+        self._loops: List[Dict[str, Any]] = []
+        self.visit(tree)
+
+    def visit(self, node: ast.AST) -> None:
+        if isinstance(node, ast.stmt):
+            self.statements.add(type(node).__name__.lower())
+        super().visit(node)
+
+    def _visit_scope(self, node: ast.AST) -> None:
+        # break/return inside a nested function or class never leaves an outer loop
+        loops, self._loops = self._loops, []
+        self.generic_visit(node)
+        self._loops = loops
+
+    def _visit_loop(self, node: ast.AST, header: List[ast.AST]) -> Dict[str, Any]:
+        for child in header:
+            self.visit(child)
+        loop = {"exits": False}
+        self._loops.append(loop)
+        for child in node.body:
+            self.visit(child)
+        self._loops.pop()
+        # A loop's else block runs after it, so its break belongs to the outer loop
+        for child in node.orelse:
+            self.visit(child)
+        return loop
+
+    def visit_While(self, node: ast.While) -> None:
+        loop = self._visit_loop(node, [node.test])
+        if isinstance(node.test, ast.Constant) and node.test.value and not loop["exits"]:
+            self.unbounded_loops += 1
+
+    def visit_For(self, node: ast.For) -> None:
+        self._visit_loop(node, [node.target, node.iter])
+
+    visit_AsyncFor = visit_For
+
+    def visit_Break(self, node: ast.Break) -> None:
+        if self._loops:
+            self._loops[-1]["exits"] = True
+
+    def _exit_all_loops(self, node: ast.AST) -> None:
+        for loop in self._loops:
+            loop["exits"] = True
+        self.generic_visit(node)
+
+    # A generator's consumer can stop it at any yield, so `while True: yield ...` ends too
+    visit_Return = visit_Raise = visit_Yield = visit_YieldFrom = _exit_all_loops
+
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
+        self.assigned.add(node.name)
+        self._visit_scope(node)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> None:
+        self.assigned.add(node.name)
+        self._visit_scope(node)
+
+    def visit_Lambda(self, node: ast.Lambda) -> None:
+        self._visit_scope(node)
+
+    def visit_Name(self, node: ast.Name) -> None:
+        if isinstance(node.ctx, ast.Store):
+            self.assigned.add(node.id)
+
+    def visit_Constant(self, node: ast.Constant) -> None:
+        self.literals.add(node.value)
+
+    def visit_Import(self, node: ast.Import) -> None:
+        for alias in node.names:
+            self.imports.append(alias.name.partition(".")[0])
+            self.assigned.add((alias.asname or alias.name).partition(".")[0])
+
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+        if node.module and node.level == 0:
+            self.imports.append(node.module.partition(".")[0])
+        self.assigned.update(alias.asname or alias.name for alias in node.names)
+
+    def visit_Call(self, node: ast.Call) -> None:
+        if (_dotted_name(node.func) == "__import__" and node.args and isinstance(node.args[0], ast.Constant)
+                and isinstance(node.args[0].value, str)):
+            self.imports.append(node.args[0].value.partition(".")[0])
+        self.generic_visit(node)
+
+    def visit_With(self, node: ast.With) -> None:
+        for item in node.items:
+            call = item.context_expr
+            is_call = isinstance(call, ast.Call)
+            self.with_items.append({
+                "call": _dotted_name(call.func) if is_call else None,
+                "args": [arg.value if isinstance(arg, ast.Constant) else _MISSING for arg in call.args] if is_call else [],
+                "as": item.optional_vars.id if isinstance(item.optional_vars, ast.Name) else None
+            })
+        self.generic_visit(node)
+
+    visit_AsyncWith = visit_With
+
+@functools.lru_cache(maxsize=64)
+def submission_facts(code: str) -> SubmissionFacts:
+    """Structural facts about a submission, extracted once and shared by every check"""
+    return SubmissionFacts(parse_submission(code))
+
+def _diagnose_with_open(facts: SubmissionFacts, filename: str, variable: str) -> Optional[str]:
     """
-    Test: Multiple choice - Variables & Data Flow
+    Check for `with open("<filename>") as <variable>:`
+    Returns None if it is present, otherwise the most specific error message
     """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
-    try:
-        # code is the selected answer (e.g., "B")
-        correct_answer = "B"
-        passed = code.strip().upper() == correct_answer
-        results["test_1"] = passed
-        if not passed:
-            all_passed = False
-        first_output = f"Selected: {code.strip()}"
-    except Exception as e:
-        results["test_1"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-    
+    opens = [item for item in facts.with_items if item["call"] == "open"]
+    opens_file = [item for item in opens if item["args"][:1] == [filename]]
+    if any(item["as"] == variable for item in opens_file):
+        return None
+
+    if "with" not in facts.statements:
+        return "Error: Code must use a 'with' statement"
+    if not opens:
+        return "Error: Must use open() function"
+    if not opens_file:
+        return f"Error: Must open '{filename}' (check spelling)"
+    if not any(item["as"] == variable for item in facts.with_items):
+        return f"Error: File must be assigned to variable named '{variable}'"
+    return f"Error: Must use 'with open(\"{filename}\") as {variable}:'"
+
+def _static_check(check: Dict[str, Any], facts: SubmissionFacts) -> Optional[str]:
+    """Evaluate a structural check without running the code; returns None on success, else an error message"""
+    if "literal" in check:
+        return None if check["literal"] in facts.literals else check["message"]
+    if "statement" in check:
+        return None if check["statement"] in facts.statements else check["message"]
+    if "with_open" in check:
+        return _diagnose_with_open(facts, check["with_open"]["file"], check["with_open"]["as"])
+    raise ValueError(f"Unknown static check: {check}")
+
+def _prescreen_forbidden_imports(facts: SubmissionFacts, modules: List[str]) -> Optional[str]:
+    # Messages carry no line numbers: results are cached by AST fingerprint,
+    # which ignores layout, so a line number could belong to another submission
+    for name in facts.imports:
+        if name in modules:
+            return f"Error: Importing '{name}' is not allowed"
+    return None
+
+def _prescreen_bounded_loops(facts: SubmissionFacts, enabled: bool) -> Optional[str]:
+    if enabled and facts.unbounded_loops:
+        return "Error: A 'while True' loop never breaks"
+    return None
+
+def _prescreen_functions(facts: SubmissionFacts, names: List[str]) -> Optional[str]:
+    # Any binding counts (a def, `square = lambda n: n * n`, an import): the
+    # grader itself checks that the name is callable
+    for name in names:
+        if name not in facts.assigned:
+            return f"Error: Code must define a function named '{name}'"
+    return None
+
+def _prescreen_assigns(facts: SubmissionFacts, names: List[str]) -> Optional[str]:
+    for name in names:
+        if name not in facts.assigned:
+            return f"Error: Code must assign a variable named '{name}'"
+    return None
+
+def _prescreen_with(facts: SubmissionFacts, required: bool) -> Optional[str]:
+    if required and "with" not in facts.statements:
+        return "Error: Code must use a 'with' statement"
+    return None
+
+# Pre-screen rules, in the order they run: spec "prescreen" key -> rule(facts, value)
+# Each returns None if the code passes, otherwise the error message
+PRESCREEN_RULES: Dict[str, Callable[[SubmissionFacts, Any], Optional[str]]] = {
+    "forbidden_imports": _prescreen_forbidden_imports,
+    "bounded_loops": _prescreen_bounded_loops,
+    "functions": _prescreen_functions,
+    "assigns": _prescreen_assigns,
+    "with": _prescreen_with,
+}
+
+# Rules applied to every code question; a spec's "prescreen" adds to or overrides them
+DEFAULT_PRESCREEN: Dict[str, Any] = {
+    "forbidden_imports": ["os", "subprocess"],
+    "bounded_loops": True,
+}
+
+def prescreen_result(message: str) -> Dict[str, Any]:
+    """Build the failed test result for a submission rejected without running it"""
     return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "Correct! A variable is a named reference that points to a value in memory." if all_passed else "Incorrect. Try again!"
+        "passed": False,
+        "tests": {"prescreen": False},
+        "output": message,
+        "message": message[len("Error: "):] if message.startswith("Error: ") else message
     }
 
-def test_pennsylvania_railroad_q1(code: str) -> Dict[str, Any]:
+def prescreen(question_id: str, code: str) -> Optional[Dict[str, Any]]:
     """
-    Test: Multiple choice - Logic & Control Flow
+    Check a submission's structure against its question's rules without running it
+    Returns None if every rule passes, otherwise the failed result for the first
+    rule that doesn't. Raises SyntaxError if the code does not parse.
     """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
-    try:
-        correct_answer = "C"
-        passed = code.strip().upper() == correct_answer
-        results["test_1"] = passed
-        if not passed:
-            all_passed = False
-        first_output = f"Selected: {code.strip()}"
-    except Exception as e:
-        results["test_1"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-    
+    spec = TEST_SPECS.get(question_id)
+    if spec is None or spec.get("type") == "multiple_choice":
+        return None
+    rules = {**DEFAULT_PRESCREEN, **spec.get("prescreen", {})}
+    facts = submission_facts(code)
+    for name, rule in PRESCREEN_RULES.items():
+        if name in rules:
+            error = rule(facts, rules[name])
+            if error:
+                return prescreen_result(error)
+    return None
+
+def _spec_result(spec: Dict[str, Any], results: Dict[str, bool], output: str) -> Dict[str, Any]:
+    passed = all(results.values())
     return {
-        "passed": all_passed,
+        "passed": passed,
         "tests": results,
-        "output": first_output,
-        "message": "Correct! Conditional statements choose between different paths of execution." if all_passed else "Incorrect. Try again!"
+        "output": output,
+        "message": spec["pass_message"] if passed else spec["fail_message"]
     }
 
-def test_bo_railroad_q1(code: str) -> Dict[str, Any]:
+def run_spec(question_id: str, code: str, mode: str = "full") -> Dict[str, Any]:
     """
-    Test: Multiple choice - Functions
+    Grade a submission against its question's declarative test spec
+    Static (source-level) checks run first; then every test case executes the
+    compiled submission in a fresh namespace and evaluates its checks.
+    In "fail_fast" mode no further cases run once one has failed.
     """
-    results = {}
-    all_passed = True
+    spec = TEST_SPECS[question_id]
+    if spec.get("type") == "multiple_choice":
+        selected = code.strip()
+        return _spec_result(spec, {"test_1": selected.upper() == spec["answer"]}, f"Selected: {selected}")
+
+    compiled = compile_submission(code)
+    results: Dict[str, bool] = {}
     first_output = ""
-    
-    try:
-        correct_answer = "B"
-        passed = code.strip().upper() == correct_answer
-        results["test_1"] = passed
-        if not passed:
-            all_passed = False
-        first_output = f"Selected: {code.strip()}"
-    except Exception as e:
-        results["test_1"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "Correct! Functions organize reusable blocks of logic." if all_passed else "Incorrect. Try again!"
-    }
 
-def test_short_line_q1(code: str) -> Dict[str, Any]:
+    for check in spec.get("static", []):
+        error = _static_check(check, submission_facts(code))
+        results[check["name"]] = error is None
+        if error and not first_output:
+            first_output = error
+    if not all(results.values()):
+        # Don't execute code that is structurally wrong
+        for i, case in enumerate(spec["cases"]):
+            results[case.get("name", f"test_{i+1}")] = False
+        return _spec_result(spec, results, first_output)
+
+    for i, case in enumerate(spec["cases"]):
+        if mode == "fail_fast" and not all(results.values()):
+            break
+        case_name = case.get("name", f"test_{i+1}")
+        requires = case.get("requires")
+        _count("cases_run")
+        run = _CaseRun(spec, case)
+        try:
+            run.run(compiled)
+        except SUBMISSION_ERRORS as e:
+            results[requires["name"] if requires else case_name] = False
+            if i == 0:
+                first_output = f"Error: {_describe_error(e)}"
+            continue
+
+        if i == 0:
+            first_output = run.output or spec.get("empty_output", "")
+
+        if requires and not _safe_evaluate(requires, run):
+            results[requires["name"]] = False
+            continue
+
+        checks = case["checks"]
+        if any("name" in check for check in checks):
+            for check in checks:
+                results[check["name"]] = _safe_evaluate(check, run)
+        else:
+            results[case_name] = all(_safe_evaluate(check, run) for check in checks)
+
+    return _spec_result(spec, results, first_output)
+
+def _reference_checks(checks: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """Checks (including "any" options) whose expectation is "$reference", in order"""
+    for check in checks:
+        if "any" in check:
+            yield from _reference_checks(check["any"])
+        elif REFERENCE in (check.get("output"), check.get("equals")):
+            yield check
+
+def build_expected_values(spec: Dict[str, Any], code: str) -> List[List[Any]]:
     """
-    Test: Multiple choice - Lists & Dictionaries
+    Run a reference solution once per test case and record the values the
+    spec's "$reference" checks observe
+    Returns one list of expected values per case, in check order
     """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
-    try:
-        correct_answer = "C"
-        passed = code.strip().upper() == correct_answer
-        results["test_1"] = passed
-        if not passed:
-            all_passed = False
-        first_output = f"Selected: {code.strip()}"
-    except Exception as e:
-        results["test_1"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "Correct! A dictionary is a structure that maps keys to values." if all_passed else "Incorrect. Try again!"
-    }
+    compiled = compile_submission(code)
+    table = []
+    for case in spec["cases"]:
+        run = _CaseRun(spec, case)
+        run.run(compiled)
+        # Round-trip through JSON so the table holds plain, comparable values
+        values = [_observe(check, run) for check in _reference_checks(case["checks"])]
+        table.append(json.loads(json.dumps(values)))
+    return table
+
+def _fill_reference_checks(question_id: str, spec: Dict[str, Any]) -> None:
+    if not any(True for case in spec.get("cases", []) for _ in _reference_checks(case["checks"])):
+        return
+    solutions = load_reference_solutions().get(question_id)
+    if not solutions:
+        raise ValueError(f"{question_id} has $reference checks but no reference solution in {ANSWER_KEY_FILE.name}")
+    for case, case_values in zip(spec["cases"], build_expected_values(spec, solutions[0])):
+        for check, value in zip(list(_reference_checks(case["checks"])), case_values):
+            check["output" if "output" in check else "equals"] = value
 
-def test_electric_company_q1(code: str) -> Dict[str, Any]:
+def verify_reference_solutions() -> List[Tuple[str, int, Dict[str, Any]]]:
     """
-    Test: Multiple choice - File I/O
+    Grade every reference solution in CODE_ANSWER_KEY.md with its own grader
+    Returns (question_id, solution index, result) for each one that fails, so
+    a broken grader is noticed before students ever submit to it
     """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
-    try:
-        correct_answer = "B"
-        passed = code.strip().upper() == correct_answer
-        results["test_1"] = passed
-        if not passed:
-            all_passed = False
-        first_output = f"Selected: {code.strip()}"
-    except Exception as e:
-        results["test_1"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "Correct! The with statement ensures the file closes properly even if an error occurs." if all_passed else "Incorrect. Try again!"
-    }
+    failures = []
+    for question_id, solutions in load_reference_solutions().items():
+        for index, code in enumerate(solutions):
+            result = run_test(question_id, code, "full")
+            if not result["passed"]:
+                failures.append((question_id, index, result))
+    return failures
 
-def test_water_works_q1(code: str) -> Dict[str, Any]:
+# Modules a fixture needs, imported once per process when the first question
+# using that fixture is graded rather than at startup
+FIXTURE_MODULES: Dict[str, Tuple[str, ...]] = {
+    "argument_parser_class": ("argparse",),
+    "argument_parser": ("argparse",),
+}
+
+class GraderRegistry(Mapping):
     """
-    Test: Multiple choice - APIs & External Data
+    Maps question_id to its grader, preparing each question on first use
+    Startup only reads the specs. The first lookup of a question imports its
+    fixtures' modules and fills in its "$reference" expectations, and later
+    lookups return the same grader without doing either again.
     """
-    results = {}
-    all_passed = True
-    first_output = ""
-    
-    try:
-        correct_answer = "B"
-        passed = code.strip().upper() == correct_answer
-        results["test_1"] = passed
-        if not passed:
-            all_passed = False
-        first_output = f"Selected: {code.strip()}"
-    except Exception as e:
-        results["test_1"] = False
-        all_passed = False
-        first_output = f"Error: {str(e)}"
-    
-    return {
-        "passed": all_passed,
-        "tests": results,
-        "output": first_output,
-        "message": "Correct! An API connects a Python script to external data or services." if all_passed else "Incorrect. Try again!"
-    }
 
-# Test registry - maps question_id to test function
-TEST_REGISTRY: Dict[str, callable] = {
-    "mediterranean_q1": test_mediterranean_q1,
-    "baltic_q1": test_baltic_q1,
-    "oriental_q1": test_oriental_q1,
-    "vermont_q1": test_vermont_q1,
-    "connecticut_q1": test_connecticut_q1,
-    "st_charles_q1": test_st_charles_q1,
-    "states_q1": test_states_q1,
-    "virginia_q1": test_virginia_q1,
-    "st_james_q1": test_st_james_q1,
-    "tennessee_q1": test_tennessee_q1,
-    "new_york_q1": test_new_york_q1,
-    "kentucky_q1": test_kentucky_q1,
-    "indiana_q1": test_indiana_q1,
-    "illinois_q1": test_illinois_q1,
-    "atlantic_q1": test_atlantic_q1,
-    "ventnor_q1": test_ventnor_q1,
-    "marvin_gardens_q1": test_marvin_gardens_q1,
-    "pacific_q1": test_pacific_q1,
-    "north_carolina_q1": test_north_carolina_q1,
-    "pennsylvania_q1": test_pennsylvania_q1,
-    "park_place_q1": test_park_place_q1,
-    "boardwalk_q1": test_boardwalk_q1,
-    "reading_railroad_q1": test_reading_railroad_q1,
-    "pennsylvania_railroad_q1": test_pennsylvania_railroad_q1,
-    "bo_railroad_q1": test_bo_railroad_q1,
-    "short_line_q1": test_short_line_q1,
-    "electric_company_q1": test_electric_company_q1,
-    "water_works_q1": test_water_works_q1,
+    def __init__(self, specs: Dict[str, Dict[str, Any]]):
+        self._specs = specs
+        self._graders: Dict[str, Callable[..., Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        # Milliseconds each question took to prepare, for startup reporting
+        self.prepare_ms: Dict[str, float] = {}
+
+    def __getitem__(self, question_id: str) -> Callable[..., Dict[str, Any]]:
+        grader = self._graders.get(question_id)
+        if grader is None:
+            if question_id not in self._specs:
+                raise KeyError(question_id)
+            with self._lock:
+                grader = self._graders.get(question_id)
+                if grader is None:
+                    grader = self._prepare(question_id)
+        return grader
+
+    def __contains__(self, question_id: object) -> bool:
+        return question_id in self._specs
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._specs)
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+    def _prepare(self, question_id: str) -> Callable[..., Dict[str, Any]]:
+        start = time.perf_counter()
+        spec = self._specs[question_id]
+        fixtures = [spec.get("fixtures", {}), spec.get("modules", {})]
+        for case in spec.get("cases", []):
+            fixtures += [case.get("fixtures", {}), case.get("modules", {})]
+        for params in (params for group in fixtures for params in group.values()):
+            for module in FIXTURE_MODULES.get(params["fixture"], ()):
+                importlib.import_module(module)
+        _fill_reference_checks(question_id, spec)
+
+        grader = functools.partial(run_spec, question_id)
+        self._graders[question_id] = grader
+        self.prepare_ms[question_id] = (time.perf_counter() - start) * 1000
+        return grader
+
+TEST_SPECS: Dict[str, Dict[str, Any]] = load_test_specs()
+
+# Test registry - maps question_id to its grader
+TEST_REGISTRY = GraderRegistry(TEST_SPECS)
+
+# Resource limits for running a grader; a spec's "limits" overrides them per question
+DEFAULT_LIMITS: Dict[str, float] = {
+    "cpu_seconds": 2,
+    "wall_seconds": 5,
+    "memory_mb": 256,
+    "output_bytes": 64 * 1024,
 }
 
-def run_test(question_id: str, code: str) -> Dict[str, Any]:
+def get_limits(question_id: str) -> Dict[str, float]:
+    """Resource limits for a question's grader"""
+    return {**DEFAULT_LIMITS, **TEST_SPECS[question_id].get("limits", {})}
+
+# "full" runs every test case to report on all of them; "fail_fast" stops at the
+# first failing case. A spec's "mode" sets a question's default
+GRADING_MODES = ("full", "fail_fast")
+DEFAULT_MODE = "full"
+
+def get_mode(question_id: str, requested: Optional[str] = None) -> str:
+    """Grading mode for a submission: the requested one, else the question's default"""
+    mode = requested or TEST_SPECS[question_id].get("mode", DEFAULT_MODE)
+    if mode not in GRADING_MODES:
+        raise ValueError(f"Unknown grading mode: {mode}")
+    return mode
+
+# Graders that look at the submitted text itself (answer letters), so two
+# submissions with the same AST can still get different results
+RAW_TEXT_GRADERS = {
+    question_id for question_id, spec in TEST_SPECS.items()
+    if spec.get("type") == "multiple_choice"
+}
+
+# Changes whenever the grading engine itself is edited
+_ENGINE_SOURCE_HASH = hashlib.sha256(Path(__file__).read_bytes()).hexdigest()
+
+@functools.lru_cache(maxsize=None)
+def grader_version(question_id: str) -> str:
+    """Fingerprint of a question's spec, limits and the engine; changes whenever any does"""
+    TEST_REGISTRY[question_id]  # hash the spec with its "$reference" values filled in
+    source = _ENGINE_SOURCE_HASH + json.dumps(TEST_SPECS[question_id], sort_keys=True)
+    source += repr(sorted(get_limits(question_id).items()))
+    return hashlib.sha256(source.encode()).hexdigest()[:16]
+
+def submission_fingerprint(question_id: str, code: str) -> str:
+    """
+    Hash of a submission that ignores whitespace and comments
+    Uses the normalized AST where the grader only depends on behaviour, and the
+    raw text otherwise (or when the code doesn't parse).
+    """
+    normalized = code.strip()
+    if question_id not in RAW_TEXT_GRADERS:
+        try:
+            normalized = ast.dump(parse_submission(code))
+        except (SyntaxError, ValueError, RecursionError, MemoryError):
+            pass
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+def run_test(question_id: str, code: str, mode: Optional[str] = None) -> Dict[str, Any]:
     """
     Run the test suite for a specific question
-    Returns test results
+    mode is "full" or "fail_fast" (see GRADING_MODES); None uses the question's default
+    Returns test results, with the submission's resource usage under "resources":
+    wall and CPU time, growth in peak memory, exec calls and test cases run
     """
     if question_id not in TEST_REGISTRY:
         return {
@@ -1570,5 +1378,82 @@ def run_test(question_id: str, code: str) -> Dict[str, Any]:
         }
     
     test_func = TEST_REGISTRY[question_id]
-    return test_func(code)
+    mode = get_mode(question_id, mode)
+    counters = {"exec_calls": 0, "cases_run": 0}
+    token = _usage_counters.set(counters)
+    if _process_limits_enabled:
+        # A grading process runs one submission at a time, so its own peak can start afresh
+        _reset_peak_rss()
+    wall_start, cpu_start, peak_start = time.perf_counter(), time.thread_time(), _peak_rss_kb()
+    try:
+        result = _run_grader(question_id, code, mode, test_func)
+    finally:
+        _usage_counters.reset(token)
+
+    peak_end = _peak_rss_kb()
+    result["resources"] = {
+        "wall_ms": round((time.perf_counter() - wall_start) * 1000, 3),
+        "cpu_ms": round((time.thread_time() - cpu_start) * 1000, 3),
+        "peak_memory_delta_kb": peak_end - peak_start if peak_end is not None else None,
+        **counters
+    }
+    return result
+
+def _run_grader(question_id: str, code: str, mode: str, test_func: Callable[..., Dict[str, Any]]) -> Dict[str, Any]:
+    """Pre-screen and grade a submission under its limits, turning failures into results"""
+    try:
+        rejected = prescreen(question_id, code)
+        if rejected:
+            return rejected
+        with enforce_limits(get_limits(question_id)):
+            return test_func(code, mode=mode)
+    except SyntaxError as e:
+        return syntax_error_result(e)
+    except (RecursionError, MemoryError):
+        # Parsing, the pre-screen's AST walk or compiling ran out of stack or
+        # memory; errors raised by running the code are handled per test case
+        return too_complex_result()
+    except OutputLimitExceeded as e:
+        return output_limit_result(e)
+    except ResourceLimitExceeded as e:
+        return limit_exceeded_result(str(e))
+
+try:
+    _malloc_trim = ctypes.CDLL(None).malloc_trim
+except (OSError, AttributeError):  # not glibc
+    _malloc_trim = None
+
+def _peak_rss_kb() -> Optional[int]:
+    """Peak resident memory of this process so far, in KB (None where unavailable)"""
+    try:
+        # Unlike ru_maxrss, VmHWM can be lowered again by _reset_peak_rss()
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kilobytes
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+def _reset_peak_rss() -> None:
+    """Lower this process's peak resident memory to its current size, where Linux allows it"""
+    if _malloc_trim is not None:
+        # Hand memory freed by earlier submissions back first, or reusing it wouldn't count
+        _malloc_trim(0)
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
 
+if __name__ == "__main__":
+    # Check that every reference solution passes its grader (e.g. before a class)
+    failures = verify_reference_solutions()
+    for question_id, index, result in failures:
+        print(f"FAIL {question_id} solution {index + 1}: {result['message']} {result['tests']}")
+    print(f"{len(failures)} reference solution(s) failed")
+    sys.exit(1 if failures else 0)